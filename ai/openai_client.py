@@ -0,0 +1,26 @@
+"""Overall Purpose:
+
+Holds the single AsyncOpenAI client shared by every service that calls the
+OpenAI HTTP API (greeting TTS, name/email extraction). Creating the client once
+at import keeps its HTTPX connection pool alive across requests, so calls reuse
+warm keep-alive connections instead of paying a new TCP + TLS handshake each time."""
+
+import httpx # HTTP client library the OpenAI SDK is built on
+from openai import AsyncOpenAI # Async variant of the official OpenAI client
+
+from config import settings # Application settings (API key)
+
+# Connection pool limits for the shared HTTPX client.
+# max_connections caps concurrent requests to OpenAI; keep-alive connections are
+# held open between calls so the next request skips the handshake.
+OPENAI_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+
+# The shared client. Import this rather than creating clients per call.
+client = AsyncOpenAI(
+    api_key=settings.OPENAI_API_KEY,
+    http_client=httpx.AsyncClient(limits=OPENAI_HTTP_LIMITS),
+)
+
+async def close_client() -> None:
+    """Closes the shared client's connection pool. Call once on application shutdown."""
+    await client.close()
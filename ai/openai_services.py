@@ -24,6 +24,7 @@ for context and data storage."""
 
 import asyncio
 import json
+import logging
 import base64
 import websockets
 from websockets.exceptions import ConnectionClosed, ConnectionClosedOK
@@ -51,6 +52,7 @@ class RealtimeOpenAIHandler:
         self.mark_queue = []
         self._is_running = False
         self.temp_name_email_storage = {"name": None, "email": None} # State specific to this call
+        self._extraction_tasks = set() # Strong references to running name/email extraction tasks
 
     async def _connect_openai(self):
         """Establishes connection to OpenAI Realtime API."""
@@ -62,18 +64,53 @@ class RealtimeOpenAIHandler:
                     "OpenAI-Beta": "realtime=v1"
                 }
             )
-            logger.info(f"[{self.call_sid}] OpenAI WebSocket connected.")
+            logger.info("[%s] OpenAI WebSocket connected.", self.call_sid)
             await self._send_session_update()
         except Exception as e:
-            logger.error(f"[{self.call_sid}] Failed to connect to OpenAI WebSocket: {e}")
+            logger.error("[%s] Failed to connect to OpenAI WebSocket: %s", self.call_sid, e)
             raise
 
+    def _load_instructions(self):
+        """Builds the session instructions from the caller's history (blocking DB work; run in a thread)."""
+        with self.db_session_factory() as db: # Create a session for this operation
+            return generate_openai_instructions(db, self.phone_number)
+
+    def _update_personal_info(self, name: str, email: str) -> bool:
+        """Stores the collected name/email for the caller (blocking DB work; run in a thread)."""
+        with self.db_session_factory() as db:
+            return crud.update_personal_info(db, self.phone_number, name, email)
+
+    async def _extract_name_and_email(self, transcript_part: str):
+        """
+        Extracts a name/email from a transcript segment into temp_name_email_storage, and stores
+        them for the caller once both are known. Runs as its own task (see _process_response_done).
+        """
+        name, email = await info_extraction.extract_name_and_email_from_text(transcript_part)
+        if name: self.temp_name_email_storage["name"] = name
+        if email: self.temp_name_email_storage["email"] = email
+
+        # Update Personal Info if Name & Email collected
+        collected_name = self.temp_name_email_storage["name"]
+        collected_email = self.temp_name_email_storage["email"]
+        if collected_name and collected_email:
+            logger.info("[%s] Both name (%s) and email (%s) collected. Updating DB.", self.call_sid, collected_name, collected_email)
+            # Reset before awaiting, so a concurrently finishing extraction doesn't update again
+            self.temp_name_email_storage = {"name": None, "email": None}
+            # Run the sync update in a worker thread so the event loop isn't blocked on the commit
+            updated = await asyncio.to_thread(self._update_personal_info, collected_name, collected_email)
+            if updated:
+                logger.info("[%s] Personal info updated in DB.", self.call_sid)
+            else:
+                # Keep the values for a later attempt, unless newer ones arrived meanwhile
+                self.temp_name_email_storage["name"] = self.temp_name_email_storage["name"] or collected_name
+                self.temp_name_email_storage["email"] = self.temp_name_email_storage["email"] or collected_email
+
     async def _send_session_update(self):
         """Sends session configuration to OpenAI."""
         if not self.openai_ws: return
 
-        with self.db_session_factory() as db: # Create a session for this operation
-            instructions, is_returning = generate_openai_instructions(db, self.phone_number)
+        # The sync DB queries run in a worker thread, so other calls' audio keeps flowing meanwhile
+        instructions, is_returning = await asyncio.to_thread(self._load_instructions)
 
         session_update = {
             "type": "session.update",
@@ -87,7 +124,9 @@ class RealtimeOpenAIHandler:
                 "temperature": 0.8,
             }
         }
-        logger.debug(f"[{self.call_sid}] Sending session update to OpenAI: {json.dumps(session_update)}")
+        # Guarded: the json.dumps() argument would otherwise be built even when DEBUG is off
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[%s] Sending session update to OpenAI: %s", self.call_sid, json.dumps(session_update))
         await self.openai_ws.send(json.dumps(session_update))
         # Optionally send initial conversation item if needed (logic from original code)
         # await self._send_initial_conversation_item(is_returning)
@@ -105,7 +144,7 @@ class RealtimeOpenAIHandler:
                 if event == 'start':
                     self.stream_sid = data['start']['streamSid']
                     # We already have call_sid and phone_number from initialization
-                    logger.info(f"[{self.call_sid}] Twilio stream started: {self.stream_sid}")
+                    logger.info("[%s] Twilio stream started: %s", self.call_sid, self.stream_sid)
                     # Reset state variables related to response timing for the new stream
                     self.response_start_timestamp_twilio = None
                     self.latest_media_timestamp = 0
@@ -122,14 +161,14 @@ class RealtimeOpenAIHandler:
                     if self.mark_queue: self.mark_queue.pop(0)
 
                 elif event == 'stop':
-                     logger.info(f"[{self.call_sid}] Twilio stream stopped.")
+                     logger.info("[%s] Twilio stream stopped.", self.call_sid)
                      # Consider closing OpenAI connection here or let handler manage lifecycle
                      break # Exit loop on stop
 
         except (ConnectionClosed, ConnectionClosedOK):
-            logger.info(f"[{self.call_sid}] Twilio WebSocket connection closed.")
+            logger.info("[%s] Twilio WebSocket connection closed.", self.call_sid)
         except Exception as e:
-            logger.error(f"[{self.call_sid}] Error in receive_from_twilio: {e}")
+            logger.error("[%s] Error in receive_from_twilio: %s", self.call_sid, e)
         finally:
              await self.stop() # Ensure cleanup on exit
 
@@ -144,8 +183,8 @@ class RealtimeOpenAIHandler:
                 response_type = response.get('type')
 
                 if response_type in settings.LOG_EVENT_TYPES:
-                    logger.info(f"[{self.call_sid}] OpenAI Event: {response_type}")
-                    # logger.debug(f"[{self.call_sid}] OpenAI Data: {response}") # More verbose
+                    logger.info("[%s] OpenAI Event: %s", self.call_sid, response_type)
+                    # logger.debug("[%s] OpenAI Data: %s", self.call_sid, response) # More verbose
 
                 if response_type == 'response.audio.delta' and 'delta' in response:
                     if not self.stream_sid: continue
@@ -170,9 +209,9 @@ class RealtimeOpenAIHandler:
                     await self._process_response_done(response)
 
         except (ConnectionClosed, ConnectionClosedOK):
-            logger.info(f"[{self.call_sid}] OpenAI WebSocket connection closed.")
+            logger.info("[%s] OpenAI WebSocket connection closed.", self.call_sid)
         except Exception as e:
-            logger.error(f"[{self.call_sid}] Error in send_to_twilio: {e}")
+            logger.error("[%s] Error in send_to_twilio: %s", self.call_sid, e)
         finally:
             await self.stop() # Ensure cleanup on exit
 
@@ -189,12 +228,12 @@ class RealtimeOpenAIHandler:
 
     async def _handle_interruption(self):
         """Handles barge-in/interruption when user speech starts."""
-        logger.info(f"[{self.call_sid}] Handling interruption.")
+        logger.info("[%s] Handling interruption.", self.call_sid)
         if self.mark_queue and self.response_start_timestamp_twilio is not None and self.last_assistant_item_id:
             elapsed_time = self.latest_media_timestamp - self.response_start_timestamp_twilio
             if elapsed_time < 0: elapsed_time = 0 # Ensure non-negative
 
-            logger.info(f"[{self.call_sid}] Truncating item {self.last_assistant_item_id} at {elapsed_time}ms")
+            logger.info("[%s] Truncating item %s at %sms", self.call_sid, self.last_assistant_item_id, elapsed_time)
             truncate_event = {
                 "type": "conversation.item.truncate",
                 "item_id": self.last_assistant_item_id,
@@ -228,43 +267,38 @@ class RealtimeOpenAIHandler:
                 # --- Actions based on transcript ---
                 # 1. Check for Demo Request
                 if any(phrase in transcript_part.lower() for phrase in ["need demo", "want demo", "show me demo"]):
-                    logger.info(f"[{self.call_sid}] Demo requested in transcript.")
+                    logger.info("[%s] Demo requested in transcript.", self.call_sid)
                     # Assuming schedule_demo is async and available
                     # await notification_service.schedule_demo(...) # Pass necessary details
 
                 # 2. Extract Name/Email (Consider doing this on the full_transcript once)
-                name, email = await info_extraction.extract_name_and_email_from_text(transcript_part)
-                if name: self.temp_name_email_storage["name"] = name
-                if email: self.temp_name_email_storage["email"] = email
+                # Fire-and-forget: extraction can wait on a batched LLM call, and awaiting it here
+                # would stall this call's OpenAI event relay (including speech_started interruptions).
+                # The task also updates Personal Info once both name & email are collected.
+                task = asyncio.create_task(self._extract_name_and_email(transcript_part))
+                self._extraction_tasks.add(task)
+                task.add_done_callback(self._extraction_tasks.discard)
 
 
         if full_transcript.strip():
-             logger.info(f"[{self.call_sid}] Full transcript segment: {full_transcript.strip()}")
+             logger.info("[%s] Full transcript segment: %s", self.call_sid, full_transcript.strip())
              # 3. Save Conversation (Consider saving at end of call instead of every turn?)
              # This requires getting the current system message potentially
              with self.db_session_factory() as db:
                  # instructions, _ = generate_openai_instructions(db, self.phone_number) # Get instructions again
-                 # crud.save_conversation(db, self.phone_number, full_transcript.strip(), instructions)
+                 # Use the background writer so the commit never blocks the audio loop:
+                 # crud.save_conversation_async(self.db_session_factory, self.phone_number, full_transcript.strip(), instructions)
                  pass # Decide on save strategy
 
-             # 4. Update Personal Info if Name & Email collected
-             collected_name = self.temp_name_email_storage["name"]
-             collected_email = self.temp_name_email_storage["email"]
-             if collected_name and collected_email:
-                 logger.info(f"[{self.call_sid}] Both name ({collected_name}) and email ({collected_email}) collected. Updating DB.")
-                 with self.db_session_factory() as db:
-                     updated = crud.update_personal_info(db, self.phone_number, collected_name, collected_email)
-                     if updated:
-                          logger.info(f"[{self.call_sid}] Personal info updated in DB.")
-                          # Reset temporary storage after successful update
-                          self.temp_name_email_storage = {"name": None, "email": None}
+             # 4. Personal Info is updated by the extraction tasks started above
+             #    (_extract_name_and_email) once both name & email are collected.
 
 
     async def start(self):
         """Starts the handler by connecting to OpenAI and running listeners."""
         if self._is_running: return
         self._is_running = True
-        logger.info(f"[{self.call_sid}] Starting RealtimeOpenAIHandler.")
+        logger.info("[%s] Starting RealtimeOpenAIHandler.", self.call_sid)
         try:
             await self._connect_openai()
             # Run listeners concurrently
@@ -273,18 +307,18 @@ class RealtimeOpenAIHandler:
                 self._send_to_twilio()
             )
         except Exception as e:
-             logger.error(f"[{self.call_sid}] Error during handler execution: {e}")
+             logger.error("[%s] Error during handler execution: %s", self.call_sid, e)
         finally:
-             logger.info(f"[{self.call_sid}] Handler process ended.")
+             logger.info("[%s] Handler process ended.", self.call_sid)
              await self.stop() # Ensure cleanup
 
     async def stop(self):
         """Stops the handler and closes connections."""
         if not self._is_running: return
         self._is_running = False
-        logger.info(f"[{self.call_sid}] Stopping RealtimeOpenAIHandler.")
+        logger.info("[%s] Stopping RealtimeOpenAIHandler.", self.call_sid)
         # Close OpenAI WebSocket
         if self.openai_ws and self.openai_ws.open:
             await self.openai_ws.close()
-            logger.info(f"[{self.call_sid}] OpenAI WebSocket closed.")
+            logger.info("[%s] OpenAI WebSocket closed.", self.call_sid)
         # Twilio WebSocket closing is handled by FastAPI/caller
\ No newline at end of file
@@ -34,6 +34,13 @@ Remember you have spoken to this caller before. Refer to the previous conversati
 Continue the conversation naturally, acknowledging past discussions if relevant.
 """
 
+# --- Precomputed Prompt Pieces ---
+# Built once at import so returning-caller prompts don't redo these concatenations per call.
+_BASE_PLUS_RETURNING = BASE_INSTRUCTIONS + "\n" + RETURNING_CALLER_INSTRUCTIONS
+# Header/footer delimiting the past-conversation summary section.
+_CTX_HEADER = "\n--- Previous Conversation Summary ---\n"
+_CTX_FOOTER = "--- End of Summary ---\n"
+
 # --- Instruction Generation Function ---
 def generate_openai_instructions(db: Session, phone_number: Optional[str]) -> Tuple[str, bool]:
     """
@@ -51,27 +58,28 @@ def generate_openai_instructions(db: Session, phone_number: Optional[str]) -> Tu
         - full_instructions (str): The complete instruction string for the AI.
         - is_returning (bool): True if past conversations were found, False otherwise.
     """
+    # Collect the prompt fragments in a list and join them once at the end,
+    # instead of re-copying a growing string with '+=' for every past call.
     # Start with the default base instructions for "Alex".
-    full_instructions = BASE_INSTRUCTIONS
+    parts = [BASE_INSTRUCTIONS]
     # Flag to indicate if the caller has previous conversations. Defaults to False.
     is_returning = False
-    # String to build the summary of past conversations. Starts empty.
-    dynamic_context = ""
     # Variable to potentially store the system message used in the last interaction (currently unused in final logic).
     previous_system_message = None
 
-    # Only attempt to retrieve history if a phone number is provided.
-    if phone_number:
+    # Only attempt to retrieve history if a phone number is provided and the caller has any.
+    # The cached existence check lets first-time callers skip the history query entirely.
+    if phone_number and crud.has_past_conversations(db, phone_number):
         # Call the CRUD function to get past conversations for this number.
-        # Assumes get_past_conversations returns a list of tuples, ordered newest first.
+        # get_past_conversations returns (transcript_preview, system_message) tuples, ordered newest first.
         past_conversations = crud.get_past_conversations(db, phone_number)
 
         # Check if any past conversations were returned.
         if past_conversations:
             # Mark the caller as returning.
             is_returning = True
-            # Append the specific instruction note for returning callers.
-            full_instructions += "\n" + RETURNING_CALLER_INSTRUCTIONS
+            # Use the base instructions with the returning-caller note already appended.
+            parts[0] = _BASE_PLUS_RETURNING
 
             # --- Handling Previous System Message (Design Choice) ---
             # Check if the most recent conversation record has a stored system message.
@@ -90,20 +98,19 @@ def generate_openai_instructions(db: Session, phone_number: Optional[str]) -> Tu
 
             # --- Build Dynamic Context from Past Transcripts ---
             # Start the context section with a clear header.
-            dynamic_context = "\n--- Previous Conversation Summary ---\n"
+            parts.append(_CTX_HEADER)
             # Iterate through the conversations in reverse order of retrieval (oldest first)
             # to present the history chronologically in the prompt.
-            for i, (transcript, _) in enumerate(reversed(past_conversations)):
+            for call_no, (transcript, _) in enumerate(past_conversations[::-1], start=1):
                  # Limit the length of each transcript summary to avoid overly long prompts
                  # (which increase cost and might exceed token limits). Appends '...' if truncated.
-                 summary = transcript[:500] + '...' if len(transcript) > 500 else transcript
+                 # The database returns at most one character past the limit, so this length check is
+                 # cheap, and a preview longer than the limit means the transcript was cut.
+                 summary = transcript[:crud.TRANSCRIPT_PREVIEW_CHARS] + '...' if len(transcript) > crud.TRANSCRIPT_PREVIEW_CHARS else transcript
                  # Add the formatted summary for this past call.
-                 dynamic_context += f"Call {len(past_conversations)-i}:\n{summary}\n\n" # Call numbers count up (1, 2, 3...)
+                 parts.append(f"Call {call_no}:\n{summary}\n\n") # Call numbers count up (1, 2, 3...)
             # Add a footer to clearly delimit the context section.
-            dynamic_context += "--- End of Summary ---\n"
-
-            # Append the generated dynamic context (summary of past calls) to the instructions.
-            full_instructions += dynamic_context
+            parts.append(_CTX_FOOTER)
 
     # Return the complete instruction string and the boolean flag.
-    return full_instructions, is_returning
\ No newline at end of file
+    return "".join(parts), is_returning
\ No newline at end of file
@@ -24,7 +24,7 @@ async def media_stream_endpoint(
 ):
     """Handles the WebSocket connection for Twilio media streams."""
     await websocket.accept()
-    logger.info(f"WebSocket connection accepted for CallSid: {call_sid}, Phone: {phone_number}")
+    logger.info("WebSocket connection accepted for CallSid: %s, Phone: %s", call_sid, phone_number)
 
     # Use the session factory directly for the handler instance
     handler = RealtimeOpenAIHandler(websocket, SessionLocal, call_sid, phone_number)
@@ -32,12 +32,12 @@ async def media_stream_endpoint(
     try:
         await handler.start()
     except WebSocketDisconnect:
-        logger.info(f"[{call_sid}] Twilio WebSocket disconnected.")
+        logger.info("[%s] Twilio WebSocket disconnected.", call_sid)
         await handler.stop() # Ensure handler cleans up
     except Exception as e:
-        logger.error(f"[{call_sid}] Error in WebSocket endpoint: {e}")
+        logger.error("[%s] Error in WebSocket endpoint: %s", call_sid, e)
         await handler.stop() # Ensure handler cleans up
     finally:
-        logger.info(f"[{call_sid}] WebSocket connection handler finished.")
+        logger.info("[%s] WebSocket connection handler finished.", call_sid)
         # Ensure handler is stopped if not already
         await handler.stop()
\ No newline at end of file
@@ -1,7 +1,13 @@
 import os
+import atexit
 import logging
+import logging.handlers
+import queue
+from typing import ClassVar
 from dotenv import load_dotenv
 from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
+from requests.adapters import HTTPAdapter
 import openai
 from pydantic_settings import BaseSettings # Use pydantic for settings management
 
@@ -9,7 +15,19 @@ from pydantic_settings import BaseSettings # Use pydantic for settings managemen
 load_dotenv()
 
 # Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Log calls only enqueue the record; a background listener thread does the actual
+# stream write, so logging never blocks the asyncio event loop on stdout/stderr I/O.
+_log_queue = queue.SimpleQueue()
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+log_listener = logging.handlers.QueueListener(_log_queue, _log_stream_handler)
+_log_queue_handler = logging.handlers.QueueHandler(_log_queue)
+# Only merge the message args here; the listener's handler applies the real format
+_log_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[_log_queue_handler], force=True)
+log_listener.start()
+# Flush any queued records on interpreter exit
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
 class Settings(BaseSettings):
@@ -24,18 +42,36 @@ class Settings(BaseSettings):
 
     # Application Settings
     PORT: int = 5050
+    TWILIO_HTTP_POOL_SIZE: int = 16 # Max concurrent keep-alive connections to the Twilio REST API
+    TWILIO_VALIDATE_SIGNATURES: bool = True # Reject webhooks without a valid X-Twilio-Signature (disable only for local testing)
+    ENV: str = "development" # "production" runs multi-worker uvicorn with uvloop/httptools and no reload
+    # Uvicorn worker processes in production (default: one per CPU core).
+    # The in-process caches (caller names in database/crud.py, conversation history, greeting
+    # lookups) are per worker and only invalidated in the worker that made the change, so
+    # with several workers a caller's name or latest history can be up to the cache TTL
+    # (5-10 minutes) stale on the other workers. Set WORKERS=1 if that matters.
+    WORKERS: int = os.cpu_count() or 1
     BASE_URL: str = f"http://localhost:{PORT}" # Default, might need adjustment for deployment
     DATABASE_URL: str = "sqlite:///./dispatch_agent.db" # Example DB URL
+    SQL_LOG_SAMPLE_RATE: float = 0.01 # Fraction of SQL statements logged when DEBUG logging is enabled
+
+    # Database Connection Pool Settings
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 40
+    DB_POOL_TIMEOUT: int = 30 # Seconds
+    DB_POOL_RECYCLE: int = 3600 # Seconds
 
     # AI Settings
     OPENAI_REALTIME_MODEL: str = "gpt-4o-mini-realtime-preview-2024-12-17"
     OPENAI_EXTRACTION_MODEL: str = "gpt-4o-mini"
     AI_VOICE: str = "sage"
-    LOG_EVENT_TYPES: List[str] = [
+    # Constant, not an env setting: ClassVar keeps it out of Pydantic validation,
+    # and a frozenset makes the per-event membership check a hash lookup.
+    LOG_EVENT_TYPES: ClassVar[frozenset[str]] = frozenset({
         'response.content.done', 'rate_limits.updated', 'response.done',
         'input_audio_buffer.committed', 'input_audio_buffer.speech_stopped',
         'input_audio_buffer.speech_started', 'response.create', 'session.created'
-    ]
+    })
     SHOW_TIMING_MATH: bool = False
 
     class Config:
@@ -58,7 +94,15 @@ if not settings.TWILIO_ACCOUNT_SID or not settings.TWILIO_AUTH_TOKEN or not sett
 openai.api_key = settings.OPENAI_API_KEY
 
 # Initialize Twilio client
-twilio_client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+# One persistent requests.Session for all REST calls, so connections (and their TLS sessions)
+# are kept alive and reused instead of handshaking on every call.
+# The pool is sized for the number of concurrent SDK calls we allow.
+_twilio_http_client = TwilioHttpClient(pool_connections=True)
+_twilio_http_client.session.mount("https://", HTTPAdapter(
+    pool_connections=1, # All requests go to a single host (api.twilio.com)
+    pool_maxsize=settings.TWILIO_HTTP_POOL_SIZE,
+))
+twilio_client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN, http_client=_twilio_http_client)
 
 logger.info("Configuration loaded successfully.")
 # You can now import 'settings', 'logger', 'twilio_client' from config
\ No newline at end of file
@@ -1,13 +1,66 @@
-# Import the Session type hint from SQLAlchemy ORM
-from sqlalchemy.orm import Session
+# Import the Session type hint from SQLAlchemy ORM, and joinedload for eager-loading relationships
+from sqlalchemy.orm import Session, joinedload
+# SQL constructs: select() statements are compiled once and cached by SQLAlchemy,
+# bindparam() lets a prebuilt statement take per-call values,
+# and func provides SQL functions (e.g. substr) used to trim data inside the database
+from sqlalchemy import select, bindparam, func, exists
+# Dialect-specific INSERTs that support ON CONFLICT (upsert)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
 # Import standard Python type hints for clarity
 from typing import List, Tuple, Optional
+# Lock shared by the cache below (FastAPI runs sync code in a thread pool)
+from threading import RLock
+# Background writer thread that takes conversation saves off the caller's critical path
+import atexit
+import queue
+import time
+from threading import Thread, Lock
+from concurrent.futures import Future
+
+# In-memory TTL cache used to memoize hot read-only lookups
+from cachetools import TTLCache, cached
+
+from config import logger
 
 # Import your specific SQLAlchemy model classes defined elsewhere (e.g., in models.py)
 from .models import PersonalInfoDB, CarrierDB, AssistantDB, ConversationDB
 
 # --- PersonalInfoDB Functions ---
 
+# Dialect-specific INSERT constructs supporting ON CONFLICT (upsert), keyed by dialect name
+_UPSERT_INSERTS = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}
+
+# Cache of caller full names keyed by phone_number, so repeat calls from the same
+# number skip the database. Kept current by get_or_create_personal_info() and
+# update_personal_info(); None (name not known yet) is cached too.
+_NAME_CACHE = TTLCache(maxsize=10_000, ttl=300)
+_NAME_CACHE_LOCK = Lock()
+
+
+def get_cached_full_name(phone_number: str) -> Tuple[bool, Optional[str]]:
+    """
+    Looks up a caller's full name in the in-memory cache, without touching the database.
+
+    Args:
+        phone_number: The caller's phone number.
+
+    Returns:
+        (found, full_name): found is False on a cache miss, in which case
+        get_or_create_personal_info() must be called. full_name may be None
+        for known callers whose name hasn't been collected yet.
+    """
+    with _NAME_CACHE_LOCK:
+        if phone_number in _NAME_CACHE:
+            return True, _NAME_CACHE[phone_number]
+    return False, None
+
+
+def _cache_full_name(phone_number: str, full_name: Optional[str]):
+    """Stores a caller's current full name in the name cache."""
+    with _NAME_CACHE_LOCK:
+        _NAME_CACHE[phone_number] = full_name
+
 
 def get_or_create_personal_info(db: Session, phone_number: str, call_sid: Optional[str] = None) -> Optional[str]:
     """
@@ -16,6 +69,9 @@ def get_or_create_personal_info(db: Session, phone_number: str, call_sid: Option
     If it doesn't exist, creates a new record with the phone number and call_sid,
     commits it, and returns None (since full_name is not yet known).
 
+    On SQLite and PostgreSQL this is a single INSERT ... ON CONFLICT statement,
+    which also makes concurrent calls for the same number safe.
+
     Args:
         db: The active SQLAlchemy session.
         phone_number: The phone number to search for or create.
@@ -24,9 +80,54 @@ def get_or_create_personal_info(db: Session, phone_number: str, call_sid: Option
     Returns:
         The full_name string if the record existed, otherwise None.
     """
+    dialect = db.get_bind().dialect
+    insert = _UPSERT_INSERTS.get(dialect.name)
+    # Databases without ON CONFLICT support use the SELECT-then-write path
+    if insert is None:
+        full_name = _select_or_create_personal_info(db, phone_number, call_sid)
+        _cache_full_name(phone_number, full_name)
+        return full_name
+
+    # Insert the record, or resolve the conflict on the existing phone number
+    stmt = insert(PersonalInfoDB).values(phone_number=phone_number, call_sid=call_sid)
+    if call_sid:
+        # Store the new call_sid. onupdate defaults don't fire for ON CONFLICT, so set updated_at explicitly.
+        # The WHERE clause skips the row write entirely when the call_sid is unchanged (e.g. webhook retries).
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[PersonalInfoDB.phone_number],
+            set_={"call_sid": stmt.excluded.call_sid, "updated_at": func.now()},
+            where=PersonalInfoDB.call_sid.is_distinct_from(stmt.excluded.call_sid))
+    else:
+        # Nothing to update, just make sure the record exists
+        stmt = stmt.on_conflict_do_nothing(index_elements=[PersonalInfoDB.phone_number])
+
+    row = None
+    if dialect.insert_returning:
+        # Get the (possibly pre-existing) full name back from the same statement
+        row = db.execute(stmt.returning(PersonalInfoDB.full_name)).first()
+    else:
+        db.execute(stmt)
+    db.commit()
+
+    # No row comes back when the existing record was left untouched (unchanged or no call_sid),
+    # or when the database can't use RETURNING; read the name directly
+    if row is None:
+        row = db.execute(select(PersonalInfoDB.full_name).where(
+            PersonalInfoDB.phone_number == phone_number)).first()
+    # Return the full name (None for new records or if never updated)
+    full_name = row[0] if row else None
+    _cache_full_name(phone_number, full_name)
+    return full_name
+
+
+def _select_or_create_personal_info(db: Session, phone_number: str, call_sid: Optional[str]) -> Optional[str]:
+    """
+    Portable fallback for get_or_create_personal_info(): looks the record up,
+    then updates the call_sid or inserts a new record as needed.
+    """
     # Query the PersonalInfoDB table
-    record = db.query(PersonalInfoDB).filter(
-        PersonalInfoDB.phone_number == phone_number).first()
+    record = db.execute(select(PersonalInfoDB).where(
+        PersonalInfoDB.phone_number == phone_number)).scalar_one_or_none()
 
     # If a record with this phone number already exists
     if record:
@@ -45,8 +146,6 @@ def get_or_create_personal_info(db: Session, phone_number: str, call_sid: Option
         db.add(new_record)
         # Commit the transaction to save the new record to the database
         db.commit()
-        # Optional: Refresh the instance to load any db-generated values (like ID) if needed later
-        # db.refresh(new_record)
         # Return None because we just created the record and don't have a full_name yet
         return None
 
@@ -66,8 +165,8 @@ def update_personal_info(db: Session, phone_number: str, name: Optional[str], em
         True if the record was found and updated, False otherwise.
     """
     # Find the record by phone number
-    record = db.query(PersonalInfoDB).filter(
-        PersonalInfoDB.phone_number == phone_number).first()
+    record = db.execute(select(PersonalInfoDB).where(
+        PersonalInfoDB.phone_number == phone_number)).scalar_one_or_none()
 
     # If the record exists
     if record:
@@ -83,17 +182,95 @@ def update_personal_info(db: Session, phone_number: str, name: Optional[str], em
         # If any field was actually updated
         if updated:
             db.commit()  # Commit the transaction to save changes
+            # Keep the name cache in step with the stored name
+            _cache_full_name(phone_number, record.full_name)
             return True  # Indicate success
     # If the record was not found or no changes were needed
     return False
 
 # --- ConversationDB Functions ---
 
+# Cache of recent conversation history keyed by (phone_number, limit).
+# History for a caller rarely changes within a few minutes, so this avoids
+# re-running the ORDER BY/LIMIT query at the start of every call.
+# Entries are invalidated by save_conversation().
+_PAST_CONV_CACHE = TTLCache(maxsize=1024, ttl=600)
+# Cache of callers known to have history (phone_number -> True), so repeat lookups skip the database.
+# False is not cached: a conversation saved by another worker process can't invalidate this
+# process's cache, and a stale False would treat a returning caller as new.
+_HAS_CONV_CACHE = TTLCache(maxsize=4096, ttl=600)
+# One lock guards both caches
+_PAST_CONV_LOCK = RLock()
+
+# Number of transcript characters callers actually use from past conversations
+TRANSCRIPT_PREVIEW_CHARS = 500
+
+# History query built once at import; only the bound values change per call.
+# Selecting columns instead of the ConversationDB entity returns plain row tuples
+# and skips building ORM instances (and their identity-map bookkeeping).
+# The transcript is truncated by the database, so long transcripts are
+# never transferred to Python in full. One extra character is fetched so callers
+# can detect truncation without asking the database for the full length.
+_PAST_CONVERSATIONS_STMT = (
+    select(func.substr(ConversationDB.transcript, 1, TRANSCRIPT_PREVIEW_CHARS + 1),
+           ConversationDB.system_message)
+    .where(ConversationDB.phone_number == bindparam("phone_number"))
+    .order_by(ConversationDB.id.desc())
+    .limit(bindparam("limit"))
+)
+
+
+def invalidate_past_conversations(phone_number: str):
+    """
+    Drops any cached conversation history for the given phone number,
+    so the next has_past_conversations()/get_past_conversations() call
+    reads from the database.
+
+    Args:
+        phone_number: The phone number whose cached history should be discarded.
+    """
+    with _PAST_CONV_LOCK:
+        _HAS_CONV_CACHE.pop(phone_number, None)
+        # Collect first: the cache cannot be mutated while iterating over it
+        stale_keys = [key for key in _PAST_CONV_CACHE if key[0] == phone_number]
+        for key in stale_keys:
+            _PAST_CONV_CACHE.pop(key, None)
 
+
+def has_past_conversations(db: Session, phone_number: str) -> bool:
+    """
+    Checks whether any conversation has been recorded for a phone number,
+    using a cheap EXISTS query. Positive results are cached for a few minutes.
+
+    Args:
+        db: The active SQLAlchemy session.
+        phone_number: The phone number to check.
+
+    Returns:
+        True if at least one conversation exists, False otherwise.
+    """
+    with _PAST_CONV_LOCK:
+        if phone_number in _HAS_CONV_CACHE:
+            return True
+    # SELECT EXISTS (...) stops at the first matching index entry
+    found = bool(db.execute(select(exists().where(ConversationDB.phone_number == phone_number))).scalar())
+    if found:
+        # History is never deleted, so True can't go stale
+        with _PAST_CONV_LOCK:
+            _HAS_CONV_CACHE[phone_number] = True
+    return found
+
+
+@cached(_PAST_CONV_CACHE, key=lambda db, phone_number, limit=3: (phone_number, limit), lock=_PAST_CONV_LOCK)
 def get_past_conversations(db: Session, phone_number: str, limit: int = 3) -> List[Tuple[str, Optional[str]]]:
     """
     Retrieves a specified number of the most recent conversation records
     for a given phone number, ordered by descending ID (newest first).
+    Results are cached per (phone_number, limit) for a few minutes.
+
+    Only the first TRANSCRIPT_PREVIEW_CHARS + 1 characters of each transcript
+    are read; a preview longer than TRANSCRIPT_PREVIEW_CHARS means the
+    transcript was cut off.
 
     Args:
         db: The active SQLAlchemy session.
@@ -101,17 +278,13 @@ def get_past_conversations(db: Session, phone_number: str, limit: int = 3) -> Li
         limit: The maximum number of conversations to return.
 
     Returns:
-        A list of tuples, where each tuple contains (transcript, system_message).
+        A list of tuples, where each tuple contains (transcript_preview, system_message).
     """
-    # Query the ConversationDB table
-    conversations = (db.query(ConversationDB)
-                     .filter(ConversationDB.phone_number == phone_number)
-                     .order_by(ConversationDB.id.desc())
-                     .limit(limit)
-                     .all())
+    # Run the prebuilt history statement with this caller's values
+    rows = db.execute(_PAST_CONVERSATIONS_STMT, {"phone_number": phone_number, "limit": limit}).all()
 
-    # Return a list comprehension extracting the desired fields into tuples
-    return [(conv.transcript, conv.system_message) for conv in conversations]
+    # Each row already behaves like a (transcript_preview, system_message) tuple
+    return rows
 
 
 def save_conversation(db: Session, phone_number: str, transcript: str, system_message: str):
@@ -137,6 +310,118 @@ def save_conversation(db: Session, phone_number: str, transcript: str, system_me
     db.commit()
     # Optional: Refresh if you need the newly generated ID immediately
     # db.refresh(conversation)
+    # The cached history for this caller is now stale
+    invalidate_past_conversations(phone_number)
+
+
+# Single background writer for conversation saves. It drains a queue in batches:
+# up to _SAVE_BATCH_SIZE rows, or whatever arrived within _SAVE_FLUSH_INTERVAL seconds
+# of the first one, are inserted with one multi-row INSERT and one commit.
+# One writer also keeps writes in submission order and avoids SQLite writer-lock contention.
+_SAVE_BATCH_SIZE = 32
+_SAVE_FLUSH_INTERVAL = 0.5
+_save_queue: "queue.Queue" = queue.Queue()
+_STOP_WRITER = object()  # Sentinel telling the writer thread to exit
+_writer_thread: Optional[Thread] = None
+_writer_lock = Lock()
+
+
+def save_conversation_async(session_factory, phone_number: str, transcript: str, system_message: str) -> Future:
+    """
+    Queues a conversation save on the background writer and returns immediately,
+    so the commit (and its fsync) stays off the call-teardown path.
+
+    Args:
+        session_factory: Callable returning a new SQLAlchemy session (e.g., SessionLocal).
+            The write runs in another thread, so it must not reuse the caller's session.
+        phone_number: The phone number associated with the conversation.
+        transcript: The text transcript of the conversation.
+        system_message: Any associated system message or context.
+
+    Returns:
+        A Future that completes once the record has been committed
+        (or holds the exception if the save failed).
+    """
+    future = Future()
+    _ensure_writer_started()
+    row = {"phone_number": phone_number, "transcript": transcript, "system_message": system_message}
+    _save_queue.put((session_factory, row, future))
+    return future
+
+
+def _ensure_writer_started():
+    """Starts the writer thread on first use."""
+    global _writer_thread
+    with _writer_lock:
+        if _writer_thread is None:
+            _writer_thread = Thread(target=_conversation_writer, name="conversation-writer", daemon=True)
+            _writer_thread.start()
+
+
+def _conversation_writer():
+    """Writer thread loop: collects a batch of queued saves and flushes it."""
+    stopping = False
+    while not stopping:
+        # Block until there is something to write
+        item = _save_queue.get()
+        if item is _STOP_WRITER:
+            break
+        batch = [item]
+        # Keep collecting until the batch is full or the flush interval has passed
+        deadline = time.monotonic() + _SAVE_FLUSH_INTERVAL
+        while len(batch) < _SAVE_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = _save_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP_WRITER:
+                stopping = True  # Flush what we have, then exit
+                break
+            batch.append(item)
+
+        # Group by session factory (normally there is just one)
+        by_factory = {}
+        for session_factory, row, future in batch:
+            by_factory.setdefault(session_factory, []).append((row, future))
+        for session_factory, items in by_factory.items():
+            _flush_conversations(session_factory, items)
+
+
+def _flush_conversations(session_factory, items: List[Tuple[dict, Future]]):
+    """Inserts a batch of conversation rows in one transaction and resolves their futures."""
+    try:
+        with session_factory() as db:
+            # One multi-row INSERT and a single commit for the whole batch
+            db.bulk_insert_mappings(ConversationDB, [row for row, _ in items])
+            db.commit()
+    except Exception as e:
+        # Nobody awaits these saves directly, so log as well as failing the futures
+        logger.error("Failed to save %s conversation(s) in background: %s", len(items), e)
+        for _, future in items:
+            future.set_exception(e)
+        return
+    for row, future in items:
+        # The cached history for this caller is now stale
+        invalidate_past_conversations(row["phone_number"])
+        future.set_result(None)
+
+
+def shutdown_persistence():
+    """Waits for queued conversation saves to finish. Call on application shutdown."""
+    global _writer_thread
+    with _writer_lock:
+        if _writer_thread is None:
+            return
+        _save_queue.put(_STOP_WRITER)
+        _writer_thread.join()
+        _writer_thread = None
+
+
+# Don't lose queued saves if the process exits without a clean app shutdown
+atexit.register(shutdown_persistence)
 
 # --- CarrierDB and AssistantDB Functions ---
 
@@ -152,13 +437,31 @@ def find_carrier_by_phone(db: Session, phone_number: str) -> Optional[CarrierDB]
     Returns:
         The CarrierDB object if found, otherwise None.
     """
-    # Query CarrierDB, filter by phone, get the first result or None
-    return db.query(CarrierDB).filter(CarrierDB.phone == phone_number).first()
+    # Select from CarrierDB, filter by phone, get the single result or None
+    return db.execute(select(CarrierDB).where(CarrierDB.phone == phone_number)).scalar_one_or_none()
+
+
+def find_carrier(db: Session, carrier_id: int) -> Optional[CarrierDB]:
+    """
+    Finds a single carrier record by its primary key.
+    Uses Session.get(), which returns an already-loaded carrier from the
+    session's identity map without querying the database.
+
+    Args:
+        db: The active SQLAlchemy session.
+        carrier_id: The carrier's database ID.
+
+    Returns:
+        The CarrierDB object if found, otherwise None.
+    """
+    return db.get(CarrierDB, carrier_id)
 
 
 def find_assistant_by_carrier(db: Session, carrier_id: int) -> Optional[AssistantDB]:
     """
     Finds an assistant record assigned to a specific carrier ID.
+    Callers already holding the CarrierDB object should use `carrier.assistant`
+    instead (free when loaded via find_carrier_with_assistant()).
 
     Args:
         db: The active SQLAlchemy session.
@@ -167,8 +470,28 @@ def find_assistant_by_carrier(db: Session, carrier_id: int) -> Optional[Assistan
     Returns:
         The AssistantDB object if found, otherwise None.
     """
-    # Query AssistantDB, filter by the foreign key carrier_id, get the first result or None
-    return db.query(AssistantDB).filter(AssistantDB.carrier_id == carrier_id).first()
+    # Select from AssistantDB, filter by the foreign key carrier_id, get the single result or None
+    return db.execute(select(AssistantDB).where(AssistantDB.carrier_id == carrier_id)).scalar_one_or_none()
+
+
+def find_carrier_with_assistant(db: Session, phone_number: str) -> Optional[CarrierDB]:
+    """
+    Finds a carrier by phone number together with its assigned assistant,
+    in a single query (LEFT OUTER JOIN) instead of find_carrier_by_phone()
+    followed by find_assistant_by_carrier().
+
+    Args:
+        db: The active SQLAlchemy session.
+        phone_number: The carrier's phone number to search for.
+
+    Returns:
+        The CarrierDB object if found (with `.assistant` already loaded, or None
+        if no assistant is assigned), otherwise None.
+    """
+    # Eager-load the one-to-one assistant relationship in the same round trip
+    return db.execute(select(CarrierDB)
+                      .options(joinedload(CarrierDB.assistant))
+                      .where(CarrierDB.phone == phone_number)).unique().scalar_one_or_none()
 
 
 def find_carrier_by_mc_number(db: Session, mc_number: str) -> Optional[CarrierDB]:
@@ -182,8 +505,8 @@ def find_carrier_by_mc_number(db: Session, mc_number: str) -> Optional[CarrierDB
     Returns:
         The CarrierDB object if found, otherwise None.
     """
-    # Query CarrierDB, filter by mc_number, get the first result or None
-    return db.query(CarrierDB).filter(CarrierDB.mc_number == mc_number).first()
+    # Select from CarrierDB, filter by mc_number, get the single result or None
+    return db.execute(select(CarrierDB).where(CarrierDB.mc_number == mc_number)).scalar_one_or_none()
 
 
 def create_carrier(db: Session, mc_number: str, city: str, state: str, phone: str, agent_name: str) -> CarrierDB:
@@ -248,5 +571,52 @@ def create_assistant(db: Session, twilio_number: str, region: str, carrier_id: i
     # Return the newly created object
     return assistant
 
+
+def create_carrier_with_assistant(db: Session, mc_number: str, city: str, state: str, phone: str,
+                                  agent_name: str, twilio_number: str, region: str) -> Tuple[CarrierDB, AssistantDB]:
+    """
+    Creates a new carrier and its assigned assistant in a single transaction.
+    Equivalent to create_carrier() followed by create_assistant(), but commits
+    (and syncs to disk) once instead of twice.
+
+    Args:
+        db: The active SQLAlchemy session.
+        mc_number: Motor Carrier number.
+        city: Carrier's city.
+        state: Carrier's state.
+        phone: Carrier's phone number.
+        agent_name: Name of the agent associated with the carrier.
+        twilio_number: The Twilio phone number assigned to the assistant.
+        region: The region the assistant operates in.
+
+    Returns:
+        A tuple (carrier, assistant) of the newly created objects, refreshed with their database IDs.
+    """
+    # Create a new CarrierDB object instance
+    carrier = CarrierDB(
+        mc_number=mc_number,
+        city=city,
+        state=state,
+        country="USA",  # Assigns a default value
+        phone=phone,
+        agent_name=agent_name
+    )
+    db.add(carrier)
+    # Send the INSERT without committing, so the carrier's ID is available for the foreign key
+    db.flush()
+    # Create the assistant linked to the new carrier
+    assistant = AssistantDB(
+        twilio_number=twilio_number,
+        region=region,
+        carrier_id=carrier.id
+    )
+    db.add(assistant)
+    # Commit both records together
+    db.commit()
+    # Refresh the objects to load database-generated values
+    db.refresh(carrier)
+    db.refresh(assistant)
+    return carrier, assistant
+
 # Placeholder comment indicating where more functions could be added
 # Add other CRUD functions as needed (e.g., for ShippingRequirementsDB)
@@ -13,7 +13,7 @@ Potentially create the database schema (tables) using tools
 like Alembic or Base.metadata.create_all().
 """
 import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, Index
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.sql import func # For default timestamps
 
@@ -73,13 +73,20 @@ class ConversationDB(Base):
     __tablename__ = "conversations"
 
     id = Column(Integer, primary_key=True, index=True)
-    phone_number = Column(String, index=True, nullable=False)
+    phone_number = Column(String, nullable=False) # Indexed via ix_conversations_phone_number_id below
     # Optional: Link to PersonalInfoDB if desired
     # caller_id = Column(Integer, ForeignKey("personal_info.id"))
     transcript = Column(Text, nullable=False)
     system_message = Column(Text, nullable=True) # System prompt used for this convo
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Composite index matching the history lookup (WHERE phone_number = ? ORDER BY id DESC LIMIT n):
+    # the newest rows for a caller are read straight from the index, with no separate sort step.
+    # It also covers plain phone_number lookups, so no single-column index is needed.
+    __table_args__ = (
+        Index("ix_conversations_phone_number_id", phone_number, id.desc()),
+    )
+
     # Relationship (optional)
     # caller_info = relationship("PersonalInfoDB", back_populates="conversations")
 
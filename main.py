@@ -11,28 +11,104 @@ Defines a simple root endpoint (/).
 Uses the Uvicorn ASGI server to run the FastAPI application, 
 making it accessible via HTTP/WebSocket."""
 
+import os
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.types import Scope, Receive, Send
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 
 # Import configurations and routers
 from config import settings, logger
 from database.session import init_db # Import DB initializer
+from database import crud
+from ai.openai_client import close_client as close_openai_client
+from services import notification_service, greeting_service
 from telephony.router import router as telephony_router
 from ai.router import router as ai_router
 from assistants.router import router as assistants_router # Assuming this exists
 
-# Initialize the database (create tables etc.)
-init_db()
+# Set by the __main__ block once it has initialized the database, before starting the
+# workers (which inherit the environment), so the workers don't each run create_all.
+_DB_INITIALIZED_ENV = "SUPERTRUCK_DB_INITIALIZED"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Runs startup work once the server actually starts serving, and cleanup on shutdown."""
+    # Initialize the database (create tables etc.). Done here rather than at import,
+    # so importing the app (reloader, tooling) doesn't touch the database.
+    # In production, prefer schema migrations (e.g. Alembic) over create_all.
+    # Skipped when `python main.py` already did it before forking the workers; when started
+    # by other means, concurrent workers are handled by init_db() itself.
+    if not os.environ.get(_DB_INITIALIZED_ENV):
+        await run_in_threadpool(init_db)
+    # The webhook/media-stream workload is I/O-bound; production is meant to run on uvloop
+    # (see the __main__ block). Warn if the server was started some other way without it.
+    if settings.ENV == "production" and not type(asyncio.get_running_loop()).__module__.startswith("uvloop"):
+        logger.warning("Not running on uvloop; start with `uvicorn main:app --loop uvloop --http httptools --workers N` for production throughput.")
+    # Start the background worker that processes queued demo requests
+    notification_service.start_demo_worker()
+    # Synthesize the generic greeting in the background, so no anonymous caller waits on TTS.
+    # Not awaited: a slow TTS round trip must not hold up startup, and until it's ready
+    # the webhooks answer with the <Say> fallback.
+    prime_task = asyncio.create_task(greeting_service.prime_generic_greeting())
+    yield
+    # Stop priming if it's still running (e.g. the TTS API is slow)
+    prime_task.cancel()
+    # Let queued demo requests finish, then stop the worker
+    await notification_service.stop_demo_worker()
+    # Flush queued background conversation saves before the process exits
+    await run_in_threadpool(crud.shutdown_persistence)
+    # Close pooled connections to the OpenAI API
+    await close_openai_client()
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    StaticFiles that marks successful responses as long-lived and immutable.
+
+    Only use this for content-addressed files (names derived from a hash of their
+    content, like the greeting audio), which never change under the same URL.
+    Starlette already sends ETag/Last-Modified, so revalidations are cheap 304s.
+    """
+    cache_control = "public, max-age=86400, immutable"
+
+    async def get_response(self, path: str, scope: Scope):
+        response = await super().get_response(path, scope)
+        # Don't let Twilio or a CDN cache 404s for files that may be generated moments later
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = self.cache_control
+        return response
+
+class AudioBypassGZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware that passes requests for the audio mount straight through.
+    MP3s are already compressed, so gzipping them only costs CPU (and breaks byte ranges).
+    """
+    skip_path_prefix = "/temp_audio_path/"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith(self.skip_path_prefix):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
 
 # Create FastAPI app instance
-app = FastAPI(title="SuperTruck AI Voice Agent")
+app = FastAPI(title="SuperTruck AI Voice Agent", lifespan=lifespan)
 
 # Mount static file directories
 # Ensure these directories exist
 app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/temp_audio_path", StaticFiles(directory="temp_audio_path"), name="temp_audio_path")
+# Greeting audio files are named by a hash of voice + text, so they can be cached downstream
+app.mount("/temp_audio_path", ImmutableStaticFiles(directory="temp_audio_path"), name="temp_audio_path")
+
+# Compress HTML/XML/JSON responses (e.g. TwiML, the root page) above 512 bytes.
+# Level 5 gets most of the size reduction at a fraction of level 9's CPU cost.
+app.add_middleware(AudioBypassGZipMiddleware, minimum_size=512, compresslevel=5)
 
 # Include routers from different modules
 app.include_router(telephony_router)
@@ -48,13 +124,27 @@ async def read_root():
 
 # Main execution block
 if __name__ == "__main__":
-    logger.info(f"Starting SuperTruck AI Voice Agent on port {settings.PORT}")
-    uvicorn.run(
-        "main:app", # Point to the FastAPI app instance
-        host="0.0.0.0",
-        port=settings.PORT,
-        reload=True # Enable auto-reload for development (disable in production)
-        # Add SSL configuration here if needed for production WSS
-        # ssl_keyfile="path/to/key.pem",
-        # ssl_certfile="path/to/cert.pem"
-    )
\ No newline at end of file
+    logger.info("Starting SuperTruck AI Voice Agent on port %s (%s)", settings.PORT, settings.ENV)
+    if settings.ENV == "production":
+        # Create the tables once here, instead of in every worker's startup
+        init_db()
+        os.environ[_DB_INITIALIZED_ENV] = "1"
+        uvicorn.run(
+            "main:app", # Point to the FastAPI app instance
+            host="0.0.0.0",
+            port=settings.PORT,
+            workers=settings.WORKERS, # Separate processes, to use several CPU cores
+            loop="uvloop",            # libuv-based event loop, faster than the stdlib asyncio loop
+            http="httptools",         # C HTTP parser
+            access_log=False          # Skip formatting a log line for every request
+            # Add SSL configuration here if needed for production WSS
+            # ssl_keyfile="path/to/key.pem",
+            # ssl_certfile="path/to/cert.pem"
+        )
+    else:
+        uvicorn.run(
+            "main:app", # Point to the FastAPI app instance
+            host="0.0.0.0",
+            port=settings.PORT,
+            reload=True # Enable auto-reload for development (reload always runs a single worker)
+        )
\ No newline at end of file
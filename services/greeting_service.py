@@ -1,11 +1,16 @@
-import os # Standard library for interacting with the operating system (potentially useful, though pathlib is used more here)
+import os # Standard library for interacting with the operating system (path checks and atomic file renames)
+import hashlib # Used to derive cache keys from the greeting voice and text
+import asyncio # Futures used to share one in-flight synthesis between concurrent callers
 from pathlib import Path # Modern library for object-oriented filesystem paths
-from typing import Optional # Type hint for values that can be None
-import openai # Import the official OpenAI client library for API calls
+from typing import Optional, Tuple, Dict # Type hints
+import aiofiles # Async file I/O so audio writes don't block the event loop
+import aiofiles.os # Async wrappers for os functions (used for the atomic rename)
+from cachetools import LRUCache # Small in-process cache of greetings known to exist on disk
 
 # Import necessary components from your project's configuration
 # Assumes 'config.py' exists with 'settings' (holding API keys, AI voice choice, etc.) and a configured 'logger'
 from config import settings, logger
+from ai.openai_client import client as openai_client # Shared AsyncOpenAI client (pooled connections)
 
 # --- Constants and Setup ---
 # Define the directory where generated audio files will be temporarily stored
@@ -14,71 +19,204 @@ TEMP_AUDIO_DIR = Path("temp_audio_path")
 # Create the directory if it doesn't already exist.
 # exist_ok=True prevents an error if the directory is already there.
 TEMP_AUDIO_DIR.mkdir(exist_ok=True)
+# Plain-string forms of the directory and its URL prefix, so the per-call path
+# building below is simple string concatenation rather than pathlib operations.
+# The URL prefix assumes that the 'TEMP_AUDIO_DIR.name' directory (e.g., 'temp_audio_path')
+# is mounted and served as static files by the web framework (like FastAPI's StaticFiles).
+_AUDIO_DIR = str(TEMP_AUDIO_DIR)
+_AUDIO_URL_PREFIX = f"/{TEMP_AUDIO_DIR.name}/"
 
-# --- Asynchronous Greeting Generation Function ---
-async def get_greeting_url(full_name: Optional[str], phone_number_cleaned: str) -> str:
+# Greeting files already known to be on disk (filename -> URL path), so repeat
+# greetings skip even the filesystem check.
+_GREETING_URL_CACHE = LRUCache(maxsize=1024)
+
+# Last greeting served to each caller: cleaned phone number -> (full_name, URL path).
+# Lets the telephony routes look up a caller's likely greeting while the DB lookup runs.
+_GREETING_BY_NUMBER = LRUCache(maxsize=4096)
+
+# Greetings currently being synthesized (filename -> future resolving to the URL path).
+# Concurrent requests for the same greeting (e.g. ring retries) wait on the first
+# request's synthesis instead of calling TTS again ("singleflight").
+_GREETING_INFLIGHT: Dict[str, asyncio.Future] = {}
+
+# Size of the chunks read from the TTS response stream and written to disk.
+_TTS_CHUNK_SIZE = 8192
+
+# Generic greeting for unknown callers (the most common case)
+GENERIC_GREETING_TEXT = "Hi there! I'm Alex, your sales agent at Super Truck AI. How can I assist you?"
+# Example of potentially adding more context (commented out)
+# GENERIC_GREETING_TEXT += " I can help with load dispatching, invoicing, accounting, IFTA filing, and optimizing your operations."
+
+def _greeting_filename(greeting_text: str) -> str:
+    """Returns the audio filename for a greeting: a hash of everything that affects the audio."""
+    greeting_key = hashlib.blake2b(f"{settings.AI_VOICE}|{greeting_text}".encode(), digest_size=16).hexdigest()
+    return f"greeting_{greeting_key}.mp3"
+
+# The generic greeting's URL is fixed for a given voice, so it is computed once here.
+# prime_generic_greeting() synthesizes the file at startup; after that, unknown callers
+# are answered from this constant with no hashing, filesystem check, or TTS call.
+_GENERIC_GREETING_FILENAME = _greeting_filename(GENERIC_GREETING_TEXT)
+GENERIC_GREETING_URL = _AUDIO_URL_PREFIX + _GENERIC_GREETING_FILENAME
+_generic_greeting_ready = False
+
+def _greeting_text(full_name: Optional[str]) -> str:
+    """Returns the greeting text for a caller: personalized if their name is known, generic otherwise."""
+    if full_name:
+        # Personalized greeting for known callers
+        return f"Hi {full_name}, welcome back to Super Truck AI. How can I help you today?"
+    # Generic greeting for unknown callers
+    return GENERIC_GREETING_TEXT
+
+def _cache_greeting_file(greeting_filename: str, greeting_url: str) -> None:
+    """Records that a greeting file is on disk (and marks the generic greeting ready when it's that one)."""
+    global _generic_greeting_ready
+    _GREETING_URL_CACHE[greeting_filename] = greeting_url
+    if greeting_filename == _GENERIC_GREETING_FILENAME:
+        _generic_greeting_ready = True
+
+def _existing_greeting_url(greeting_filename: str) -> Optional[str]:
+    """Returns the URL path of an already-synthesized greeting file, or None if it isn't on disk."""
+    greeting_url = _GREETING_URL_CACHE.get(greeting_filename)
+    if greeting_url is not None:
+        return greeting_url
+    # Files are named by content hash, so one written by an earlier process or another worker is reused
+    if os.path.exists(f"{_AUDIO_DIR}/{greeting_filename}"):
+        greeting_url = _AUDIO_URL_PREFIX + greeting_filename
+        _cache_greeting_file(greeting_filename, greeting_url)
+        return greeting_url
+    return None
+
+async def prime_generic_greeting() -> None:
     """
-    Generates a greeting audio file using OpenAI Text-to-Speech (TTS),
-    saves it locally, and returns a relative URL path for serving the file.
+    Synthesizes the generic greeting (if not already on disk) so no caller waits for it.
+    Started once at application startup as a background task; until it finishes, callers
+    get the <Say> fallback. Failures are logged, not raised: the greeting will then be
+    generated on the first anonymous call instead.
+    """
+    try:
+        # Marks the generic greeting ready once it's on disk (no caller is recorded for it)
+        await _synthesize_greeting(GENERIC_GREETING_TEXT, "generic greeting")
+    except Exception as e:
+        logger.warning("Could not prime the generic greeting; it will be generated on first use: %s", e)
+
+def ready_generic_greeting_url() -> Optional[str]:
+    """Returns the generic greeting's URL path if its audio is already on disk, otherwise None."""
+    if _generic_greeting_ready:
+        return GENERIC_GREETING_URL
+    # Priming may have failed; the file can still have been written since (by a later call or another worker)
+    return _existing_greeting_url(_GENERIC_GREETING_FILENAME)
+
+def find_greeting_url(full_name: Optional[str], phone_number_cleaned: str) -> Optional[str]:
+    """
+    Returns the caller's greeting URL path if that greeting's audio is already on disk.
+    Never calls TTS, so it is safe on the webhook's critical path.
 
     Args:
-        full_name: The caller's full name, if known (used for personalization). None otherwise.
-        phone_number_cleaned: The caller's phone number, cleaned of special characters
-                              (e.g., '+', '-', ' ') suitable for use in filenames.
+        full_name: The caller's full name, if known. None otherwise.
+        phone_number_cleaned: The caller's phone number, cleaned as for get_greeting_url.
+
+    Returns:
+        The relative URL path to the audio file, or None if it still has to be generated.
+    """
+    greeting_url = _existing_greeting_url(_greeting_filename(_greeting_text(full_name)))
+    if greeting_url is None:
+        return None
+    return _remember_greeting(phone_number_cleaned, full_name, greeting_url)
+
+def _remember_greeting(phone_number_cleaned: str, full_name: Optional[str], greeting_url: str) -> str:
+    """Records the greeting served to a caller (for get_cached_greeting_url) and returns its URL."""
+    _GREETING_BY_NUMBER[phone_number_cleaned] = (full_name, greeting_url)
+    return greeting_url
+
+async def get_cached_greeting_url(phone_number_cleaned: str) -> Optional[Tuple[Optional[str], str]]:
+    """
+    Returns the greeting last served to this caller, if its audio file is still on disk.
+
+    Args:
+        phone_number_cleaned: The caller's phone number, cleaned as for get_greeting_url.
+
+    Returns:
+        (full_name, greeting_url_path) the greeting was generated for, or None.
+        Callers must check that full_name still matches before reusing the URL.
+    """
+    cached = _GREETING_BY_NUMBER.get(phone_number_cleaned)
+    if cached is None:
+        return None
+    # The file can disappear if the temp audio directory is cleaned up
+    if not await aiofiles.os.path.exists(f"{_AUDIO_DIR}/{cached[1].rsplit('/', 1)[1]}"):
+        _GREETING_BY_NUMBER.pop(phone_number_cleaned, None)
+        return None
+    return cached
+
+async def _synthesize_greeting(greeting_text: str, log_label: str) -> str:
+    """
+    Returns the URL path of the audio for a greeting text, synthesizing it with OpenAI TTS
+    unless it's already on disk (or being synthesized by a concurrent request).
+
+    Args:
+        greeting_text: The text to speak.
+        log_label: What the greeting is for (e.g. the caller's number), used in log messages.
 
     Returns:
-        A string representing the relative URL path to the generated audio file
-        (e.g., "/temp_audio_path/greeting_1234567890.mp3").
+        The relative URL path to the audio file.
 
     Raises:
-        Exception: Can re-raise exceptions from the OpenAI API call or file saving
-                   if error handling is not implemented with a fallback.
+        Exception: Re-raises exceptions from the OpenAI API call or file saving.
     """
     # --- Filename and Path Generation ---
-    # Create a unique filename for the audio file using the cleaned phone number.
-    # This helps in potentially reusing/caching greetings and avoids filename conflicts.
-    # Using the *cleaned* number prevents issues with characters like '+' in filenames or URLs.
-    greeting_filename = f"greeting_{phone_number_cleaned}.mp3"
-    # Construct the full path to where the audio file will be saved.
-    audio_file_path = TEMP_AUDIO_DIR / greeting_filename # pathlib uses '/' for joining paths
+    # The same greeting text (and voice) always maps to the same file.
+    greeting_filename = _greeting_filename(greeting_text)
 
-    # --- Greeting Text Generation ---
-    # Determine the greeting text based on whether the caller's name is known.
-    if full_name:
-        # Personalized greeting for known callers
-        greeting_text = f"Hi {full_name}, welcome back to Super Truck AI. How can I help you today?"
-    else:
-        # Generic greeting for unknown callers
-        greeting_text = f"Hi there! I'm Alex, your sales agent at Super Truck AI. How can I assist you?"
-        # Example of potentially adding more context (commented out)
-        # greeting_text += " I can help with load dispatching, invoicing, accounting, IFTA filing, and optimizing your operations."
+    # --- Cache Lookup ---
+    # Reuse the audio if this exact greeting was already synthesized.
+    cached_url = _existing_greeting_url(greeting_filename)
+    if cached_url is not None:
+        return cached_url
+    # Construct the full path to where the audio file will be saved, and its URL.
+    audio_file_path = f"{_AUDIO_DIR}/{greeting_filename}"
+    greeting_url = _AUDIO_URL_PREFIX + greeting_filename
+
+    # --- Singleflight ---
+    # If this greeting is already being synthesized, wait for that instead of starting another.
+    # shield(): a waiter being cancelled must not cancel the shared future.
+    inflight = _GREETING_INFLIGHT.get(greeting_filename)
+    if inflight is not None:
+        return await asyncio.shield(inflight) # Re-raises if the first synthesis failed
+    inflight = asyncio.get_running_loop().create_future()
+    _GREETING_INFLIGHT[greeting_filename] = inflight
 
     # Log the generated greeting text for debugging/monitoring purposes
-    logger.info(f"Generating greeting for {phone_number_cleaned}: '{greeting_text}'")
+    logger.info("Generating greeting for %s: '%s'", log_label, greeting_text)
 
     # --- OpenAI TTS API Call and File Saving ---
     try:
-        # Call the OpenAI TTS API asynchronously.
-        # 'await' is used because this is an async function making a network request.
-        # Ensure your openai client is initialized correctly (likely using settings.OPENAI_API_KEY)
-        response = await openai.audio.speech.create(
+        # Write to a temporary name and rename it into place, so a concurrent request
+        # never finds (and serves) a half-written cached file.
+        temp_file_path = f"{audio_file_path}.{os.getpid()}.tmp"
+        # Call the OpenAI TTS API asynchronously and stream the audio straight to disk.
+        # Both the download and the file writes are awaited, so other calls keep being
+        # served while the greeting is synthesized.
+        async with openai_client.audio.speech.with_streaming_response.create(
             model="tts-1",          # Specify the TTS model (e.g., "tts-1", "tts-1-hd")
             voice=settings.AI_VOICE,# Use the AI voice specified in the application settings
             input=greeting_text,    # Provide the text to be converted to speech
-        )
-
-        # Save the audio content received from the API response to the local file.
-        # The specific method (`stream_to_file`) depends on the OpenAI library version.
-        # Always check the documentation for the current recommended way to save audio streams.
-        # Using 'str(audio_file_path)' converts the Path object to a string, which might be required by the library function.
-        response.stream_to_file(str(audio_file_path))
+        ) as response:
+            async with aiofiles.open(temp_file_path, "wb") as audio_file:
+                async for chunk in response.iter_bytes(_TTS_CHUNK_SIZE):
+                    await audio_file.write(chunk)
+        await aiofiles.os.replace(temp_file_path, audio_file_path)
+        _cache_greeting_file(greeting_filename, greeting_url)
 
         # Log successful creation and saving of the audio file
-        logger.info(f"Greeting audio saved to: {audio_file_path}")
+        logger.info("Greeting audio saved to: %s", audio_file_path)
+        inflight.set_result(greeting_url)
 
     except Exception as e:
         # Catch any errors during the API call or file writing process.
-        logger.error(f"Error generating greeting audio for {phone_number_cleaned}: {e}")
+        logger.error("Error generating greeting audio for %s: %s", log_label, e)
+        # Fail the waiters too; .exception() marks the error as retrieved in case nobody waits
+        inflight.set_exception(e)
+        inflight.exception()
         # --- Fallback Strategy (Optional) ---
         # Option 1: Raise the exception to let the caller handle it.
         raise
@@ -86,10 +224,50 @@ async def get_greeting_url(full_name: Optional[str], phone_number_cleaned: str)
         # return f"/{TEMP_AUDIO_DIR.name}/default_greeting.mp3"
         # Option 3: Return None or an empty string and handle it downstream.
         # return None
+    finally:
+        _GREETING_INFLIGHT.pop(greeting_filename, None)
+        # If this request was cancelled mid-synthesis, release the waiters (they will see an error)
+        if not inflight.done():
+            inflight.set_exception(RuntimeError("Greeting synthesis was interrupted"))
+            inflight.exception()
+
+    return greeting_url
+
+# --- Asynchronous Greeting Generation Function ---
+async def get_greeting_url(full_name: Optional[str], phone_number_cleaned: str) -> str:
+    """
+    Generates a greeting audio file using OpenAI Text-to-Speech (TTS),
+    saves it locally, and returns a relative URL path for serving the file.
+
+    Files are named after a hash of the voice and greeting text, so identical
+    greetings (every anonymous caller, or the same returning caller) are
+    synthesized once and then served from disk.
+
+    Args:
+        full_name: The caller's full name, if known (used for personalization). None otherwise.
+        phone_number_cleaned: The caller's phone number, cleaned of special characters
+                              (e.g., '+', '-', ' '). Used for logging.
+
+    Returns:
+        A string representing the relative URL path to the audio file
+        (e.g., "/temp_audio_path/greeting_<hash>.mp3").
+
+    Raises:
+        Exception: Can re-raise exceptions from the OpenAI API call or file saving
+                   if error handling is not implemented with a fallback.
+    """
+    # --- Precomputed Generic Greeting ---
+    # Unknown callers get the greeting synthesized at startup.
+    if not full_name and _generic_greeting_ready:
+        return _remember_greeting(phone_number_cleaned, full_name, GENERIC_GREETING_URL)
+
+    # --- Greeting Text Generation ---
+    # Determine the greeting text based on whether the caller's name is known.
+    greeting_text = _greeting_text(full_name)
+
+    # --- Audio File (synthesized unless already on disk) ---
+    greeting_url = await _synthesize_greeting(greeting_text, phone_number_cleaned)
 
     # --- Return Relative URL Path ---
-    # Construct and return the relative URL path.
-    # This path assumes that the 'TEMP_AUDIO_DIR.name' directory (e.g., 'temp_audio_path')
-    # will be mounted and served as static files by the web framework (like FastAPI's StaticFiles).
-    # Example: If TEMP_AUDIO_DIR is Path("temp_audio_path"), this returns "/temp_audio_path/greeting_1234567890.mp3"
-    return f"/{TEMP_AUDIO_DIR.name}/{greeting_filename}"
\ No newline at end of file
+    # Example: If TEMP_AUDIO_DIR is Path("temp_audio_path"), this returns "/temp_audio_path/greeting_<hash>.mp3"
+    return _remember_greeting(phone_number_cleaned, full_name, greeting_url)
\ No newline at end of file
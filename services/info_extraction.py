@@ -6,16 +6,180 @@ an OpenAI language model (specifically via the Chat Completions endpoint)
 to identify and extract any full name and email address mentioned within
 that text. It's designed to return the results in a structured way (a tuple)
 and handle cases
-where the information isn't found or an error occurs."""
+where the information isn't found or an error occurs.
 
-import openai # Import the official OpenAI client library
-from typing import Tuple, Optional # Import type hints for clarity and static analysis
+Concurrent extraction requests are coalesced by a small asyncio micro-batcher
+into a single Chat Completion call with a JSON array of texts."""
+
+import re # Regular expressions for the local (no network) extraction fast path
+import json # Parses the model's JSON-mode output
+import logging # For level checks that skip building debug-only arguments
+import asyncio # Used by the micro-batcher that coalesces concurrent extraction requests
+from typing import Tuple, Optional, List, Set, Dict # Import type hints for clarity and static analysis
 from config import settings, logger # Import application settings (API keys, model names) and logger
+from ai.openai_client import client as openai_client # Shared AsyncOpenAI client (pooled connections)
+
+# --- Fast Path Patterns (compiled once at import) ---
+# An email address spelled out in the text.
+EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+# An explicit self-introduction followed by a capitalized full name (2-3 words),
+# e.g. "my name is John Smith". Only the lead-in is case-insensitive.
+# Looser lead-ins ("this is", "I am") are deliberately not matched: they precede ordinary
+# Title-Case phrases too ("this is Super Truck AI", "I am Really Glad"), and the transcripts
+# include the assistant's own speech.
+NAME_RE = re.compile(r"\b(?i:my name is|my name's)\s+([A-Z][a-z'-]+(?:\s+[A-Z][a-z'-]+){1,2})\b")
+
+# Texts shorter than this (after stripping) are skipped without any extraction attempt.
+_MIN_TEXT_LENGTH = 6
+
+# --- Micro-Batching ---
+# Requests arriving within _BATCH_MAX_WAIT seconds of each other (up to _BATCH_MAX_SIZE)
+# are sent to OpenAI as one JSON array, amortizing the round trip and system prompt.
+_BATCH_MAX_SIZE = 8
+_BATCH_MAX_WAIT = 0.05
+# Completion tokens budgeted per item. A typical {"id": N, "name": ..., "email": ...} entry
+# is ~30 tokens; the headroom covers long names/emails and whitespace the model adds, since
+# a truncated reply is not valid JSON. Plus some for the surrounding {"results": [...]} wrapper.
+_TOKENS_PER_ITEM = 80
+_TOKENS_OVERHEAD = 20
+
+_batch_queue: Optional[asyncio.Queue] = None # Pending (text, future) pairs
+_batcher_task: Optional[asyncio.Task] = None # Background task draining _batch_queue
+_inflight_batches: Set[asyncio.Task] = set() # Strong references to running batch calls
+
+_SYSTEM_MESSAGE = (
+    'The user message is a JSON array of {"id": int, "text": str} items, each a separate transcript. '
+    "Extract the person's full name and email address from each item's text on its own. "
+    'Return JSON {"results": [{"id": int, "name": str|null, "email": str|null}]} '
+    "with one entry per item, echoing its id; use null when a field is not present."
+)
+
+def _ensure_batcher_started() -> asyncio.Queue:
+    """Starts the batcher task on the running event loop if needed and returns its queue."""
+    global _batch_queue, _batcher_task
+    loop = asyncio.get_running_loop()
+    # (Re)create the batcher if it was never started, has died, or belongs to another loop.
+    if _batcher_task is None or _batcher_task.done() or _batcher_task.get_loop() is not loop:
+        _batch_queue = asyncio.Queue()
+        _batcher_task = loop.create_task(_extraction_batcher(_batch_queue))
+    return _batch_queue
+
+async def _extraction_batcher(batch_queue: asyncio.Queue) -> None:
+    """Collects queued requests into batches and dispatches each batch to OpenAI."""
+    loop = asyncio.get_running_loop()
+    while True:
+        # Block until the first request arrives, then gather more until the batch is full or the window closes.
+        batch = [await batch_queue.get()]
+        deadline = loop.time() + _BATCH_MAX_WAIT
+        while len(batch) < _BATCH_MAX_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(batch_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Run the API call as its own task so the next batch can start forming meanwhile.
+        task = loop.create_task(_run_extraction_batch(batch))
+        _inflight_batches.add(task)
+        task.add_done_callback(_inflight_batches.discard)
+
+def _parse_results(result_text: str) -> Dict[int, Tuple[Optional[str], Optional[str]]]:
+    """
+    Parses the model's JSON output: {"results": [{"id": N, "name": ..., "email": ...}, ...]}.
+
+    Args:
+        result_text: The model's full output (a JSON object, guaranteed by JSON mode).
+
+    Returns:
+        A dict mapping each item number to its (extracted_name, extracted_email) tuple,
+        with None for fields the model reported as missing.
+
+    Raises:
+        ValueError: If the output is not valid JSON.
+    """
+    results = {}
+    for item in json.loads(result_text).get("results", []):
+        # The model may echo the id as a string ("1"); entries without a usable id are skipped
+        try:
+            item_id = int(item.get("id"))
+        except (TypeError, ValueError):
+            continue
+        name = item.get("name") or None
+        email = item.get("email") or None
+        results[item_id] = (
+            name,
+            # Perform a very basic check to see if it looks like an email.
+            email if email and "@" in email and "." in email else None,
+        )
+    return results
+
+async def _run_extraction_batch(batch: List[Tuple[str, asyncio.Future]]) -> None:
+    """
+    Sends one Chat Completion request for a batch of texts and resolves each caller's future.
+
+    Args:
+        batch: (text, future) pairs; each future receives that text's (name, email) tuple.
+    """
+    # --- Prompt Engineering ---
+    # Give each text an id so results can be matched back to their callers.
+    # The texts are sent as a JSON array rather than a free-text list: a transcript containing
+    # newlines, quotes or 'N. "' then can't shift item boundaries (and mix up callers' details).
+    # The instructions live in the (constant) system message; the user message is just the texts.
+    items_json = json.dumps([{"id": i, "text": text} for i, (text, _) in enumerate(batch, start=1)])
+
+    # --- OpenAI API Call ---
+    try:
+        response = await openai_client.chat.completions.create(
+            # Specify the model to use, configured in application settings.
+            model=settings.OPENAI_EXTRACTION_MODEL,
+            messages=[
+                # System message sets the task and the JSON schema of the output.
+                {"role": "system", "content": _SYSTEM_MESSAGE},
+                # User message provides the texts to analyze.
+                {"role": "user", "content": items_json}
+            ],
+            # JSON mode guarantees syntactically valid JSON, so no free-text parsing is needed.
+            response_format={"type": "json_object"},
+            # Low temperature makes the output more deterministic and focused, suitable for extraction.
+            temperature=0.1,
+            # Budget just enough output tokens for one JSON entry per item.
+            max_tokens=_TOKENS_PER_ITEM * len(batch) + _TOKENS_OVERHEAD
+        )
+        choice = response.choices[0]
+        result_text = choice.message.content
+        logger.debug("Batched name/email extraction raw result (%s items): '%s'", len(batch), result_text)
+
+        # A reply cut off at max_tokens is incomplete JSON. Retry the items one by one,
+        # so a single long entry doesn't fail every caller in the batch.
+        if choice.finish_reason == "length":
+            if len(batch) > 1:
+                logger.warning("Batched extraction output was truncated; retrying %s items individually", len(batch))
+                await asyncio.gather(*(_run_extraction_batch([item]) for item in batch))
+                return
+            raise ValueError("Extraction output was truncated at the token limit")
+
+        # --- Response Parsing ---
+        results = _parse_results(result_text)
+    except Exception as e:
+        # Fail every request in the batch; callers handle the error individually.
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+        return
+
+    # Map each result back to its item; items the model skipped resolve to (None, None).
+    for i, (_, future) in enumerate(batch, start=1):
+        if not future.done(): # The caller may have been cancelled meanwhile
+            future.set_result(results.get(i, (None, None)))
 
 async def extract_name_and_email_from_text(text: str) -> Tuple[Optional[str], Optional[str]]:
     """
-    Uses an OpenAI Chat Completion model to extract a person's full name and
-    email address from a given block of text.
+    Extracts a person's full name and email address from a given block of text.
+
+    Explicit emails and self-introductions ("my name is ...") are matched with
+    regular expressions first; the OpenAI Chat Completion model is only called
+    when either field is still missing, batched with other concurrent requests.
 
     Args:
         text: The input string (e.g., conversation transcript) to analyze.
@@ -32,83 +196,48 @@ async def extract_name_and_email_from_text(text: str) -> Tuple[Optional[str], Op
         logger.debug("Input text for name/email extraction is empty.")
         return None, None
 
-    # --- Prompt Engineering ---
-    # Define the prompt that instructs the AI model on what to do.
-    # This prompt specifies the task, how to handle missing information ('None'),
-    # and crucially, the exact output format required for reliable parsing later.
-    prompt = f"""
-    Analyze the following text and extract the person's full name and email address if present.
-    If a name is mentioned, provide the full name.
-    If an email address is mentioned, provide the email address.
-    If either is not found, output 'None' for that field.
-    Format the output *exactly* as: Name: [extracted name or None] | Email: [extracted email or None]
-
-    Text: "{text}"
-    """
+    # Short utterances ("yes", "okay", "hmm") can't hold a full name or an email.
+    # A full name needs at least one space and an email needs an '@', so skip anything with neither.
+    stripped_text = text.strip()
+    if len(stripped_text) < _MIN_TEXT_LENGTH or ("@" not in stripped_text and " " not in stripped_text):
+        logger.debug("Input text for name/email extraction is too short to contain a name or email.")
+        return None, None
 
-    # --- OpenAI API Call ---
+    # --- Regex Fast Path ---
+    # Compiled regexes run in microseconds; if both fields are found there is no need for the LLM.
+    email_match = EMAIL_RE.search(text)
+    name_match = NAME_RE.search(text)
+    regex_email = email_match.group(0) if email_match else None
+    regex_name = name_match.group(1) if name_match else None
+    if regex_name and regex_email:
+        # Per-call result logs are DEBUG: they fire on every transcript (and contain caller PII)
+        logger.debug("Regex extraction results - Name: %s, Email: %s", regex_name, regex_email)
+        return regex_name, regex_email
+
+    # --- Batched OpenAI Call ---
     try:
-        # Log the attempt to extract information.
-        logger.debug(f"Attempting to extract name/email from text: '{text[:100]}...'")
+        # Log the attempt to extract information (skip the slice when DEBUG is off).
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Attempting to extract name/email from text: '%s...'", text[:100])
 
-        # Make an asynchronous call to the OpenAI Chat Completions endpoint.
-        # 'await' is used because this function and the API call are asynchronous.
-        response = await openai.chat.completions.create(
-            # Specify the model to use, configured in application settings.
-            # Different models may have varying performance and cost for extraction tasks.
-            model=settings.OPENAI_EXTRACTION_MODEL,
-            messages=[
-                # System message sets the context/role for the AI. It reinforces the output format.
-                {"role": "system", "content": "You are an expert text analysis assistant. Extract names and emails precisely. Output only in the format 'Name: [name/None] | Email: [email/None]'."},
-                # User message provides the specific instructions and the text to analyze.
-                {"role": "user", "content": prompt}
-            ],
-            # Low temperature makes the output more deterministic and focused, suitable for extraction.
-            temperature=0.1,
-            # Limit the maximum number of tokens in the response to control cost and prevent overly long/irrelevant answers.
-            # 50 tokens should be sufficient for the "Name: ... | Email: ..." format.
-            max_tokens=50
-        )
-        # Extract the text content from the first choice in the response.
-        result_text = response.choices[0].message.content.strip()
-        # Log the raw response from the AI for debugging.
-        logger.debug(f"Name/Email extraction raw result: '{result_text}'")
+        # Queue the text for the micro-batcher and wait for this item's result.
+        future = asyncio.get_running_loop().create_future()
+        _ensure_batcher_started().put_nowait((text, future))
+        extracted_name, extracted_email = await future
 
-        # --- Response Parsing ---
-        # Initialize variables to store extracted data. Default to None.
-        extracted_name = None
-        extracted_email = None
-
-        # Parse the structured output based on the format requested in the prompt.
-        parts = result_text.split('|') # Split the response by the expected separator '|'
-        if len(parts) == 2: # Expecting two parts: Name and Email
-            # Parse the Name part
-            name_part = parts[0].split('Name:', 1) # Split by 'Name:' separator (limit to 1 split)
-            if len(name_part) == 2:
-                name_str = name_part[1].strip() # Get the value after 'Name:' and remove whitespace
-                # Check if the extracted value is not the literal string 'None' (case-insensitive)
-                if name_str.lower() != 'none':
-                    extracted_name = name_str # Assign the found name
-
-            # Parse the Email part
-            email_part = parts[1].split('Email:', 1) # Split by 'Email:' separator
-            if len(email_part) == 2:
-                email_str = email_part[1].strip() # Get the value after 'Email:'
-                # Check if the extracted value is not 'None'
-                if email_str.lower() != 'none':
-                    # Perform a very basic check to see if it looks like an email.
-                    # This could be replaced with more robust regex validation if needed.
-                    if '@' in email_str and '.' in email_str:
-                        extracted_email = email_str # Assign the found email
+        # The model reads the name in context, so its answer wins; the regex name only fills a gap.
+        # A literal email match is exact, so it takes precedence over the model's output.
+        extracted_name = extracted_name or regex_name
+        extracted_email = regex_email or extracted_email
 
         # Log the final parsed results.
-        logger.info(f"Parsed extraction results - Name: {extracted_name}, Email: {extracted_email}")
+        logger.debug("Parsed extraction results - Name: %s, Email: %s", extracted_name, extracted_email)
         # Return the parsed (or None) name and email.
         return extracted_name, extracted_email
 
     # --- Error Handling ---
     except Exception as e:
         # Log any exception that occurs during the API call or parsing.
-        logger.error(f"Error extracting name/email from text '{text[:50]}...': {e}")
-        # Return None for both fields in case of any error.
-        return None, None
\ No newline at end of file
+        logger.error("Error extracting name/email from text '%s...': %s", text[:50], e)
+        # Return whatever the regex fast path found (None otherwise) in case of any error.
+        return regex_name, regex_email
\ No newline at end of file
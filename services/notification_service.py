@@ -3,6 +3,16 @@ from typing import Optional
 
 from config import logger
 
+# --- Background Demo Queue ---
+# schedule_demo() only enqueues; a single background worker (started from the app lifespan)
+# does the slow part, so webhook/WebSocket handlers never wait on email/CRM APIs.
+DEMO_QUEUE_MAXSIZE = 1000
+# How long shutdown waits for queued demo requests to finish before giving up.
+DEMO_QUEUE_DRAIN_TIMEOUT = 5.0
+
+_demo_queue: asyncio.Queue = asyncio.Queue(maxsize=DEMO_QUEUE_MAXSIZE)
+_demo_worker_task: Optional[asyncio.Task] = None
+
 async def schedule_demo(
     transcript: str,
     call_sid: Optional[str],
@@ -10,6 +20,30 @@ async def schedule_demo(
     # Add other relevant parameters like extracted name/email if available
     name: Optional[str] = None,
     email: Optional[str] = None
+):
+    """
+    Queues a demo request for the background worker and returns immediately.
+    The request is dropped (and logged) if the queue is full, rather than
+    stalling the caller.
+    """
+    job = {
+        "transcript": transcript,
+        "call_sid": call_sid,
+        "phone_number": phone_number,
+        "name": name,
+        "email": email,
+    }
+    try:
+        _demo_queue.put_nowait(job)
+    except asyncio.QueueFull:
+        logger.error("Demo queue full; dropping demo request for CallSid: %s, Phone: %s.", call_sid, phone_number)
+
+async def _process_demo_request(
+    transcript: str,
+    call_sid: Optional[str],
+    phone_number: Optional[str],
+    name: Optional[str] = None,
+    email: Optional[str] = None
 ):
     """
     Handles the logic for scheduling a demo when requested.
@@ -35,7 +69,37 @@ async def schedule_demo(
     # Simulate async work if needed
     await asyncio.sleep(0.1)
 
-    logger.info(f"Demo scheduling action placeholder completed for CallSid: {call_sid}.")
+    logger.info("Demo scheduling action placeholder completed for CallSid: %s.", call_sid)
+
+async def _demo_worker():
+    """Drains the demo queue forever, processing one request at a time."""
+    while True:
+        job = await _demo_queue.get()
+        try:
+            await _process_demo_request(**job)
+        except Exception as e:
+            # One failed request must not stop the worker
+            logger.error("Error processing demo request for CallSid: %s: %s", job.get('call_sid'), e)
+        finally:
+            _demo_queue.task_done()
+
+def start_demo_worker():
+    """Starts the background demo worker on the running event loop. Call once from the app lifespan."""
+    global _demo_worker_task
+    if _demo_worker_task is None or _demo_worker_task.done():
+        _demo_worker_task = asyncio.create_task(_demo_worker())
+
+async def stop_demo_worker():
+    """Waits briefly for queued demo requests to finish, then stops the worker."""
+    global _demo_worker_task
+    if _demo_worker_task is None:
+        return
+    try:
+        await asyncio.wait_for(_demo_queue.join(), timeout=DEMO_QUEUE_DRAIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("Shutting down with %s demo request(s) still queued.", _demo_queue.qsize())
+    _demo_worker_task.cancel()
+    _demo_worker_task = None
 
 # Example helper function (conceptual)
 # async def send_sales_notification(name, email, phone, transcript):
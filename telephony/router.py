@@ -10,42 +10,124 @@ A helper function to parse incoming data from Twilio requests.
 An API endpoint that your application can call internally to trigger actions,
 like initiating an outgoing call.
 """
-from fastapi import APIRouter, Request, Depends, Response
-from sqlalchemy.orm import Session
-import phonenumbers # For cleaning phone numbers
-
-from database.session import get_db
+import asyncio
+import base64
+import hashlib
+import hmac
+import re
+from functools import lru_cache
+from urllib.parse import parse_qsl
+from typing import Optional, Tuple
+
+from fastapi import APIRouter, Request, Depends, Response, HTTPException, BackgroundTasks
+from sqlalchemy.ext.asyncio import AsyncSession
+import phonenumbers # For cleaning phone numbers (installed as phonenumberslite: same API, no geocoder/carrier data)
+
+from database.session import get_db, DatabaseSession
 from database import crud
 from services import greeting_service
 from . import twilio_service # Import functions from the service module
-from config import logger
+from config import settings, logger
 
 router = APIRouter(
     prefix="/telephony", # Add prefix for organization
     tags=["Telephony"]   # Tag for Swagger UI
 )
 
+# Fixed TwiML bodies for the webhook error paths, encoded once at import
+_ERR_TWIML = b"<Response><Say>An internal error occurred.</Say></Response>"
+_HANGUP_TWIML = b"<Response><Hangup/></Response>"
+_BAD_REQ_TWIML = b"<Response><Say>Error processing call.</Say></Response>"
+
+# Twilio sends From/To already in E.164 ("+" then up to 15 digits, no leading zero)
+_E164_RE = re.compile(r"^\+[1-9]\d{6,14}$")
+
+@lru_cache(maxsize=4096)
+def _normalize_e164(raw: str) -> Optional[str]:
+    """
+    Returns the phone number in E.164 format, or None if it isn't a valid number.
+    Numbers already in E.164 form (what Twilio sends) are accepted by a regex check;
+    anything else goes through the full phonenumbers parse/validate/format pipeline.
+    Results are memoized, since the same callers and agent numbers recur constantly.
+    """
+    if _E164_RE.match(raw):
+        return raw
+    try:
+        parsed = phonenumbers.parse(raw, None) # Assume country if needed
+        if phonenumbers.is_valid_number(parsed):
+            return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+    except phonenumbers.NumberParseException as e:
+        logger.warning(f"Could not parse phone number: {e}")
+    return None
+
+async def _read_twilio_params(request: Request) -> dict:
+    """
+    Returns the webhook's form fields. Twilio posts small application/x-www-form-urlencoded
+    bodies, which are parsed directly with parse_qsl instead of going through
+    Starlette's form/multipart machinery; any other content type falls back to request.form().
+    The result is kept on request.state, so the signature check and the handler parse only once.
+    """
+    params = getattr(request.state, "twilio_params", None)
+    if params is not None:
+        return params
+    if request.headers.get('content-type', '').startswith('application/x-www-form-urlencoded'):
+        raw = await request.body()
+        params = dict(parse_qsl(raw.decode('utf-8'), keep_blank_values=True, max_num_fields=64))
+    else:
+        params = await request.form()
+    request.state.twilio_params = params
+    return params
+
+_TWILIO_AUTH_TOKEN = settings.TWILIO_AUTH_TOKEN.encode()
+
+def _twilio_signature(url: str, params: dict) -> str:
+    """
+    Computes Twilio's X-Twilio-Signature for a request: base64(HMAC-SHA1(auth_token,
+    url + each POST param name and value, sorted by name)). hmac/hashlib run in C (OpenSSL).
+    """
+    payload = url + "".join(f"{key}{params[key]}" for key in sorted(params))
+    digest = hmac.new(_TWILIO_AUTH_TOKEN, payload.encode(), hashlib.sha1).digest()
+    return base64.b64encode(digest).decode()
+
+async def verify_twilio_signature(request: Request):
+    """
+    Dependency for the Twilio webhooks: rejects requests whose X-Twilio-Signature doesn't
+    match, before any TwiML, greeting, or DB work is done for them.
+    Disabled when settings.TWILIO_VALIDATE_SIGNATURES is False (e.g. local testing).
+    """
+    if not settings.TWILIO_VALIDATE_SIGNATURES:
+        return
+    signature = request.headers.get("X-Twilio-Signature")
+    if not signature:
+        raise HTTPException(status_code=403, detail="Missing Twilio signature.")
+    # GET webhooks carry their parameters in the (signed) URL itself
+    try:
+        params = await _read_twilio_params(request) if request.method == "POST" else {}
+    except (ValueError, UnicodeDecodeError):
+        # Too many fields (parse_qsl's max_num_fields) or a non-UTF-8 body: not a Twilio request
+        logger.warning("Rejected Twilio webhook with a malformed body: %s", request.url.path)
+        raise HTTPException(status_code=400, detail="Malformed request body.")
+    # Twilio signs the public URL it called; behind a proxy/tunnel that is BASE_URL + path,
+    # which can differ from the URL the app server sees.
+    query = f"?{request.url.query}" if request.url.query else ""
+    candidate_urls = (f"{settings.BASE_URL}{request.url.path}{query}", str(request.url))
+    # Compare as bytes: compare_digest() raises TypeError for non-ASCII str, and headers are
+    # decoded as latin-1, so a garbage header must fail the check rather than cause a 500.
+    signature_bytes = signature.encode("latin-1")
+    if not any(hmac.compare_digest(_twilio_signature(url, params).encode(), signature_bytes) for url in candidate_urls):
+        logger.warning("Rejected Twilio webhook with invalid signature: %s", request.url.path)
+        raise HTTPException(status_code=403, detail="Invalid Twilio signature.")
+
 async def parse_twilio_request(request: Request) -> dict:
     """Helper to parse Twilio form data."""
-    form_data = await request.form()
+    form_data = await _read_twilio_params(request)
     call_sid = form_data.get('CallSid')
     from_number_raw = form_data.get('From')
     to_number_raw = form_data.get('To') # Needed for outgoing handler context
 
-    # Clean and validate phone numbers (using phonenumbers library)
-    from_number = None
-    to_number = None
-    try:
-        if from_number_raw:
-            parsed_from = phonenumbers.parse(from_number_raw, None) # Assume country if needed
-            if phonenumbers.is_valid_number(parsed_from):
-                from_number = phonenumbers.format_number(parsed_from, phonenumbers.PhoneNumberFormat.E164)
-        if to_number_raw:
-            parsed_to = phonenumbers.parse(to_number_raw, None)
-            if phonenumbers.is_valid_number(parsed_to):
-                to_number = phonenumbers.format_number(parsed_to, phonenumbers.PhoneNumberFormat.E164)
-    except phonenumbers.NumberParseException as e:
-        logger.warning(f"Could not parse phone number: {e}")
+    # Clean and validate phone numbers (regex fast path, phonenumbers library otherwise)
+    from_number = _normalize_e164(from_number_raw) if from_number_raw else None
+    to_number = _normalize_e164(to_number_raw) if to_number_raw else None
 
     return {
         "call_sid": call_sid,
@@ -55,115 +137,209 @@ async def parse_twilio_request(request: Request) -> dict:
     }
 
 
-@router.api_route("/incoming-call", methods=["GET", "POST"])
-async def handle_incoming(request: Request, db: Session = Depends(get_db)):
-    """Handles incoming calls to the main Twilio number."""
+async def _record_call_in_background(phone_number: str, call_sid: str) -> None:
+    """Stores the caller's latest call_sid after the TwiML response has been sent (own DB session)."""
     try:
-        data = await parse_twilio_request(request)
-        call_sid = data["call_sid"]
-        phone_number = data["from_number"]
-
-        if not call_sid or not phone_number:
-            logger.error("Missing CallSid or From number in Twilio request.")
-            return Response(content="<Response><Say>Error processing call.</Say></Response>", media_type="application/xml")
-
-        logger.info(f"Incoming call received - CallSid: {call_sid}, From: {phone_number}")
-
-        # Get/Create Personal Info & Greeting
-        full_name = crud.get_or_create_personal_info(db, phone_number, call_sid)
-        logger.info(f"Caller Full Name (from DB): {full_name}")
-        cleaned_number = phone_number.replace("+", "") # For filename/URL safety
-        greeting_url_path = await greeting_service.get_greeting_url(full_name, cleaned_number)
-        full_greeting_url = f"{request.base_url}{greeting_url_path.lstrip('/')}"
-
-        # Generate TwiML to play greeting and connect to WebSocket
-        twiml_content = twilio_service.create_greeting_and_connect_stream_twiml(
-            full_greeting_url, call_sid, phone_number
-        )
-        return Response(content=twiml_content, media_type="application/xml")
-
+        async with DatabaseSession() as db:
+            await db.run_sync(crud.get_or_create_personal_info, phone_number, call_sid)
     except Exception as e:
-        logger.error(f"Error handling incoming call: {e}", exc_info=True)
-        return Response(content="<Response><Say>An internal error occurred.</Say></Response>", media_type="application/xml")
+        logger.error("[%s] Failed to record call for %s: %s", call_sid, phone_number, e)
 
 
-@router.api_route("/agent-incoming-call", methods=["GET", "POST"])
-async def handle_agent_incoming(request: Request, db: Session = Depends(get_db)):
-    """Handles incoming calls to numbers assigned to agents/carriers."""
-    # Similar logic to handle_incoming, but might have different greeting logic
-    # or context based on the 'To' number (the agent's assigned number)
+async def _prepare_greeting_in_background(full_name: Optional[str], cleaned_number: str) -> None:
+    """Synthesizes the caller's greeting after the response has been sent, so their next call can play it."""
+    try:
+        await greeting_service.get_greeting_url(full_name, cleaned_number)
+    except Exception:
+        pass # get_greeting_url already logged the error; the caller keeps getting the fallback
+
+
+async def _resolve_caller_greeting(
+    db: AsyncSession,
+    phone_number: str,
+    call_sid: str,
+    background_tasks: BackgroundTasks
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Looks up (or creates) the caller's record and picks their greeting audio.
+
+    Twilio drops calls whose webhook answers too slowly, so nothing slow runs before the
+    TwiML is returned: greeting synthesis (a TTS round trip) and, for callers whose name is
+    already cached, the call_sid write are done as background tasks after the response.
+
+    Returns:
+        (full_name, greeting_url_path). full_name is None for callers whose name isn't known;
+        greeting_url_path is None if no greeting audio is ready (the TwiML then uses <Say>).
+    """
+    # For filename/URL safety. Numbers from parse_twilio_request are always E.164 ("+" then digits),
+    # so dropping the first character is enough.
+    cleaned_number = phone_number[1:]
+    found, full_name = crud.get_cached_full_name(phone_number)
+    if found:
+        # Repeat caller: the name comes from memory; the call_sid is stored after the response
+        background_tasks.add_task(_record_call_in_background, phone_number, call_sid)
+        cached_greeting = await greeting_service.get_cached_greeting_url(cleaned_number)
+    else:
+        # run_sync runs the sync CRUD function on the async session, so the query is awaited, not blocking.
+        # The caller's last greeting is looked up at the same time, overlapping the two I/O waits.
+        full_name, cached_greeting = await asyncio.gather(
+            db.run_sync(crud.get_or_create_personal_info, phone_number, call_sid),
+            greeting_service.get_cached_greeting_url(cleaned_number),
+        )
+    # Reuse the last greeting only if it was made for the same name
+    if cached_greeting is not None and cached_greeting[0] == full_name:
+        return full_name, cached_greeting[1]
+    # Not served by this process yet (e.g. after a restart, or on another worker): the audio
+    # may still be on disk, since files are named by the greeting's content hash.
+    greeting_url_path = greeting_service.find_greeting_url(full_name, cleaned_number)
+    if greeting_url_path is not None:
+        return full_name, greeting_url_path
+    # Otherwise answer with the generic greeting (or the <Say> fallback if it isn't primed yet)
+    # and (re)generate this caller's greeting in the background for their next call.
+    background_tasks.add_task(_prepare_greeting_in_background, full_name, cleaned_number)
+    return full_name, greeting_service.ready_generic_greeting_url()
+
+
+async def _webhook(
+    request: Request,
+    db: Optional[AsyncSession],
+    kind: str,
+    background_tasks: Optional[BackgroundTasks] = None
+) -> Response:
+    """
+    Shared body of the Twilio voice webhooks: parses the request, validates it,
+    and returns the TwiML for the given kind of call.
+
+    Args:
+        request: The incoming Twilio webhook request.
+        db: Async DB session (required by the incoming kinds; None for "outgoing").
+        background_tasks: Work to run after the response is sent (required by the incoming kinds).
+        kind: "incoming" (main number), "agent" (agent/carrier number) or
+              "outgoing" (an outgoing call was answered).
+    """
+    # Outgoing calls hang up on errors; incoming callers hear a short message
+    error_twiml = _HANGUP_TWIML if kind == "outgoing" else _ERR_TWIML
     try:
         data = await parse_twilio_request(request)
         call_sid = data["call_sid"]
+
+        if kind == "outgoing":
+            to_number = data["to_number"] # The number being called
+            if not call_sid or not to_number:
+                logger.error("Missing CallSid or To number in Twilio outgoing handler request.")
+                return Response(content=_HANGUP_TWIML, media_type="application/xml")
+
+            logger.info(f"Outgoing call connected - CallSid: {call_sid}, To: {to_number}")
+
+            # Generate TwiML to say greeting and connect to WebSocket
+            twiml_content = twilio_service.create_outgoing_connect_stream_twiml(
+                call_sid, to_number # Pass context
+            )
+            return Response(content=twiml_content, media_type="application/xml")
+
         phone_number = data["from_number"] # Caller's number
-        agent_number = data["to_number"] # The number that was called
+        if kind == "agent":
+            agent_number = data["to_number"] # The number that was called
+            if not call_sid or not phone_number or not agent_number:
+                logger.error("Missing CallSid, From, or To number in Twilio agent request.")
+                return Response(content=_BAD_REQ_TWIML, media_type="application/xml")
 
-        if not call_sid or not phone_number or not agent_number:
-            logger.error("Missing CallSid, From, or To number in Twilio agent request.")
-            return Response(content="<Response><Say>Error processing call.</Say></Response>", media_type="application/xml")
+            logger.info(f"Agent Incoming Call - CallSid: {call_sid}, From: {phone_number}, To: {agent_number}")
 
-        logger.info(f"Agent Incoming Call - CallSid: {call_sid}, From: {phone_number}, To: {agent_number}")
+            # --- Add logic specific to agent calls ---
+            # Maybe lookup carrier/agent based on agent_number?
+            # Customize greeting?
+            # Example: Use standard greeting for now
+        else:
+            if not call_sid or not phone_number:
+                logger.error("Missing CallSid or From number in Twilio request.")
+                return Response(content=_BAD_REQ_TWIML, media_type="application/xml")
 
-        # --- Add logic specific to agent calls ---
-        # Maybe lookup carrier/agent based on agent_number?
-        # Customize greeting?
+            logger.info(f"Incoming call received - CallSid: {call_sid}, From: {phone_number}")
 
-        # Example: Use standard greeting for now
-        full_name = crud.get_or_create_personal_info(db, phone_number, call_sid)
-        cleaned_number = phone_number.replace("+", "")
-        greeting_url_path = await greeting_service.get_greeting_url(full_name, cleaned_number)
-        full_greeting_url = f"{request.base_url}{greeting_url_path.lstrip('/')}"
+        # Get/Create Personal Info & Greeting
+        full_name, greeting_url_path = await _resolve_caller_greeting(db, phone_number, call_sid, background_tasks)
+        logger.info(f"Caller Full Name: {full_name}")
+        # base_url ends with "/" and greeting URL paths start with one
+        full_greeting_url = str(request.base_url) + greeting_url_path[1:] if greeting_url_path else None
 
+        # Generate TwiML to play greeting and connect to WebSocket (already-encoded bytes, sent as-is)
         twiml_content = twilio_service.create_greeting_and_connect_stream_twiml(
             full_greeting_url, call_sid, phone_number # Pass caller's number for context
         )
         return Response(content=twiml_content, media_type="application/xml")
 
     except Exception as e:
-        logger.error(f"Error handling agent incoming call: {e}", exc_info=True)
-        return Response(content="<Response><Say>An internal error occurred.</Say></Response>", media_type="application/xml")
+        logger.error(f"Error handling {kind} call webhook: {e}", exc_info=True)
+        return Response(content=error_twiml, media_type="application/xml")
 
 
-@router.api_route("/outgoing-call-handler", methods=["GET", "POST"])
-async def handle_outgoing_handler(request: Request, db: Session = Depends(get_db)):
-     """Provides TwiML when an outgoing call connects."""
-     # This endpoint is requested by Twilio *after* twilio_service.make_twilio_outgoing_call
-     # successfully initiates the call.
-     try:
-         data = await parse_twilio_request(request)
-         call_sid = data["call_sid"]
-         to_number = data["to_number"] # The number being called
+@router.api_route("/incoming-call", methods=["GET", "POST"], dependencies=[Depends(verify_twilio_signature)])
+async def handle_incoming(request: Request, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+    """Handles incoming calls to the main Twilio number."""
+    return await _webhook(request, db, "incoming", background_tasks)
 
-         if not call_sid or not to_number:
-             logger.error("Missing CallSid or To number in Twilio outgoing handler request.")
-             return Response(content="<Response><Hangup/></Response>", media_type="application/xml")
 
-         logger.info(f"Outgoing call connected - CallSid: {call_sid}, To: {to_number}")
+@router.api_route("/agent-incoming-call", methods=["GET", "POST"], dependencies=[Depends(verify_twilio_signature)])
+async def handle_agent_incoming(request: Request, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+    """Handles incoming calls to numbers assigned to agents/carriers."""
+    # Same flow as handle_incoming, but might get different greeting logic
+    # or context based on the 'To' number (the agent's assigned number)
+    return await _webhook(request, db, "agent", background_tasks)
 
-         # Generate TwiML to say greeting and connect to WebSocket
-         twiml_content = twilio_service.create_outgoing_connect_stream_twiml(
-             call_sid, to_number # Pass context
-         )
-         return Response(content=twiml_content, media_type="application/xml")
 
-     except Exception as e:
-         logger.error(f"Error handling outgoing call handler: {e}", exc_info=True)
-         return Response(content="<Response><Hangup/></Response>", media_type="application/xml")
+@router.api_route("/outgoing-call-handler", methods=["GET", "POST"], dependencies=[Depends(verify_twilio_signature)])
+async def handle_outgoing_handler(request: Request):
+    """Provides TwiML when an outgoing call connects."""
+    # This endpoint is requested by Twilio *after* twilio_service.make_twilio_outgoing_call
+    # successfully initiates the call.
+    # No DB session dependency: the outgoing TwiML never touches the database.
+    return await _webhook(request, None, "outgoing")
 
 
 # Example endpoint to trigger an outgoing call (can be used by a frontend/API)
 @router.post("/initiate-call")
 async def initiate_outgoing_call(to_number: str):
     """API endpoint to trigger making an outgoing call."""
-    try:
-        # Basic validation (can be improved)
-        if not to_number or not to_number.startswith('+'):
-             raise ValueError("Invalid 'to_number' format. Must be E.164.")
+    # Cheap E.164 shape check: malformed numbers are rejected in microseconds,
+    # without a Twilio REST round trip (and as a client error, not a 500)
+    if not _E164_RE.match(to_number):
+        raise HTTPException(status_code=422, detail="Invalid 'to_number' format. Must be E.164.")
 
+    try:
         call_sid = await twilio_service.make_twilio_outgoing_call(to_number)
         return {"status": "success", "message": "Outgoing call initiated.", "call_sid": call_sid}
     except Exception as e:
         logger.error(f"Failed to initiate outgoing call to {to_number}: {e}")
         # Return appropriate HTTP error
-        from fastapi import HTTPException
-        raise HTTPException(status_code=500, detail=f"Failed to initiate call: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to initiate call: {str(e)}")
+
+
+# Upper bound on numbers per bulk request, to keep a single request's fan-out reasonable
+MAX_BULK_CALLS = 100
+
+@router.post("/initiate-calls")
+async def initiate_outgoing_calls(to_numbers: list[str]):
+    """
+    API endpoint to trigger outgoing calls to several numbers in one request.
+    The Twilio calls are made concurrently (bounded by the Twilio thread/connection pool);
+    one failing number doesn't affect the others.
+    """
+    if not to_numbers or len(to_numbers) > MAX_BULK_CALLS:
+        raise HTTPException(status_code=422, detail=f"Provide between 1 and {MAX_BULK_CALLS} numbers.")
+    invalid = [n for n in to_numbers if not _E164_RE.match(n)]
+    if invalid:
+        raise HTTPException(status_code=422, detail=f"Invalid E.164 numbers: {', '.join(invalid)}")
+
+    results = await asyncio.gather(
+        *(twilio_service.make_twilio_outgoing_call(n) for n in to_numbers),
+        return_exceptions=True
+    )
+    calls = []
+    for to_number, result in zip(to_numbers, results):
+        if isinstance(result, Exception):
+            # make_twilio_outgoing_call already logged the error
+            calls.append({"to_number": to_number, "status": "error", "detail": str(result)})
+        else:
+            calls.append({"to_number": to_number, "status": "success", "call_sid": result})
+    return {"status": "success", "message": "Outgoing calls processed.", "calls": calls}
\ No newline at end of file
@@ -7,18 +7,74 @@ Search for and purchase Twilio phone numbers using the REST API.
 These functions bridge the application's logic with Twilio's capabilities,
 setting up calls to be connected to the real-time AI handler via Media Streams."""
 
-import asyncio # Used for asyncio.to_thread to run sync code in async apps
-from twilio.twiml.voice_response import VoiceResponse, Connect # Twilio helper library classes for generating TwiML
+import asyncio # Used to run the synchronous Twilio SDK calls off the event loop
+import functools # functools.partial binds arguments for run_in_executor
+from concurrent.futures import ThreadPoolExecutor # Dedicated threads for Twilio SDK calls
+from xml.sax.saxutils import escape # XML-escape values filled into the TwiML templates
+from twilio.twiml.voice_response import VoiceResponse, Connect # Used once at import to build the TwiML templates
 from config import twilio_client, settings, logger # Import configured Twilio client, app settings, and logger
-from typing import Optional # Type hint for optional return values
+from typing import Optional, Callable, Any # Type hints
+
+# Dedicated, bounded thread pool for the synchronous Twilio SDK. Unlike asyncio.to_thread
+# (the loop's shared default executor), bursts of Twilio calls can't starve other blocking
+# work, and concurrency matches the Twilio HTTP connection pool size.
+_twilio_pool = ThreadPoolExecutor(max_workers=settings.TWILIO_HTTP_POOL_SIZE, thread_name_prefix="twilio-sdk")
+
+async def _run_twilio(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Runs a synchronous Twilio SDK call on the Twilio thread pool and awaits its result."""
+    return await asyncio.get_running_loop().run_in_executor(_twilio_pool, functools.partial(func, *args, **kwargs))
 
 # --- TwiML Generation Functions ---
 
+# The TwiML documents below have a fixed structure where only the URLs vary, so each variant
+# is built ONCE here with Twilio's VoiceResponse/Connect helpers (using placeholder URLs),
+# serialized and encoded to bytes. Per call, only the placeholders are swapped with
+# bytes.replace() instead of building and serializing an XML tree.
+# Values are XML-escaped when filled in; the URL attribute is double-quoted in the
+# serialized output, so '"' is escaped there as well.
+# Host part of BASE_URL, used for the media stream WebSocket URLs.
+# Assumes settings.BASE_URL is like 'http://yourdomain.com' or 'https://yourdomain.com';
+# .split('//', 1)[1] extracts 'yourdomain.com'. Computed once here instead of per call.
+_WS_HOST = settings.BASE_URL.split('//', 1)[1]
+# Webhook Twilio requests when an outgoing call is answered (see make_twilio_outgoing_call)
+_OUTGOING_WEBHOOK_URL = f"{settings.BASE_URL}/telephony/outgoing-call-handler"
+
+# Placeholders substituted at runtime (plain ASCII, so serialization leaves them untouched)
+_PLAY_PLACEHOLDER = b"__PLAY__"
+_WS_PLACEHOLDER = b"__WS__"
+_ATTR_ENTITIES = {'"': "&quot;"} # Extra escaping for values placed in a double-quoted attribute
+
+def _build_stream_twiml(play_url: Optional[str] = None, say_text: Optional[str] = None) -> bytes:
+    """
+    Builds a TwiML template that plays audio and/or says text, then connects the media stream.
+
+    Args:
+        play_url: URL (or placeholder) for a <Play> followed by a 1 second <Pause>, if given.
+        say_text: Text for a <Say>, if given.
+
+    Returns:
+        The serialized TwiML, UTF-8 encoded, with the stream URL set to the WS placeholder.
+    """
+    response = VoiceResponse()
+    if play_url is not None:
+        response.play(play_url)
+        response.pause(length=1)
+    if say_text is not None:
+        response.say(say_text)
+    connect = Connect()
+    connect.stream(url=_WS_PLACEHOLDER.decode())
+    response.append(connect)
+    return str(response).encode()
+
+_INCOMING_TMPL_WITH_GREETING = _build_stream_twiml(play_url=_PLAY_PLACEHOLDER.decode())
+_INCOMING_TMPL_NO_GREETING = _build_stream_twiml(say_text="Connecting your call.")
+_OUTGOING_TMPL = _build_stream_twiml(say_text="Hello! This is Alex from Super Truck AI.")
+
 def create_greeting_and_connect_stream_twiml(
     greeting_audio_url: Optional[str], # URL of a pre-generated audio file to play (can be None)
     call_sid: str,                     # The specific Call SID for context
     phone_number: str                  # The caller's phone number for context
-    ) -> str:
+    ) -> bytes:
     """
     Generates TwiML for an INCOMING call. It plays a greeting audio (if provided)
     or says a fallback message, then connects the call's audio
@@ -30,48 +86,33 @@ def create_greeting_and_connect_stream_twiml(
         phone_number: The phone number of the caller.
 
     Returns:
-        A string containing the generated TwiML XML.
+        The generated TwiML XML, UTF-8 encoded (ready to use as a Response body).
     """
-    # Instantiate a TwiML VoiceResponse object
-    response = VoiceResponse()
-
-    # Check if a greeting audio URL was successfully generated/provided
-    if greeting_audio_url:
-        # If yes, instruct Twilio to play the audio file from the URL
-        response.play(greeting_audio_url)
-        # Optional: Add a short pause after the greeting
-        response.pause(length=1)
-    else:
-        # If no greeting URL (e.g., TTS failed), play a generic fallback message
-        response.say("Connecting your call.") # Use Twilio's default TTS
-
-    # Create a TwiML <Connect> verb object
-    connect = Connect()
-
     # Define the WebSocket URL for the media stream.
     # It points to the endpoint handled by `media_stream_endpoint`.
     # Crucially, it embeds the call_sid and phone_number in the URL path
     # so the WebSocket handler knows the context of the connection.
-    # Assumes settings.BASE_URL is like 'http://yourdomain.com' or 'https://yourdomain.com'
-    # .split('//')[1] extracts 'yourdomain.com'
-    websocket_url = f"wss://{settings.BASE_URL.split('//')[1]}/media-stream/{call_sid}/{phone_number}"
+    websocket_url = f"wss://{_WS_HOST}/media-stream/{call_sid}/{phone_number}"
     logger.info(f"[{call_sid}] Generating TwiML to connect INCOMING call to WebSocket: {websocket_url}")
 
-    # Instruct Twilio to stream the call's audio using the <Stream> noun within <Connect>.
-    # Twilio will initiate a WebSocket connection to this URL.
-    connect.stream(url=websocket_url)
+    ws_bytes = escape(websocket_url, _ATTR_ENTITIES).encode()
 
-    # Append the <Connect> verb (containing the <Stream>) to the main response
-    response.append(connect)
-
-    # Return the entire TwiML response as an XML string
-    return str(response)
+    # Check if a greeting audio URL was successfully generated/provided
+    if greeting_audio_url:
+        # If yes, <Play> the audio file from the URL, pause briefly, then <Connect> the <Stream>
+        return (
+            _INCOMING_TMPL_WITH_GREETING
+            .replace(_PLAY_PLACEHOLDER, escape(greeting_audio_url).encode())
+            .replace(_WS_PLACEHOLDER, ws_bytes)
+        )
+    # If no greeting URL (e.g., TTS failed), <Say> a generic fallback message with Twilio's default TTS
+    return _INCOMING_TMPL_NO_GREETING.replace(_WS_PLACEHOLDER, ws_bytes)
 
 
 def create_outgoing_connect_stream_twiml(
     call_sid: str,      # The specific Call SID for context
     to_phone_number: str # The number being called for context
-) -> str:
+) -> bytes:
     """
     Generates TwiML for an OUTGOING call *after* it has been answered.
     It says a brief initial greeting (as the AI) and then immediately
@@ -82,30 +123,14 @@ def create_outgoing_connect_stream_twiml(
         to_phone_number: The phone number that was dialed.
 
     Returns:
-        A string containing the generated TwiML XML.
+        The generated TwiML XML, UTF-8 encoded (ready to use as a Response body).
     """
-    # Instantiate a TwiML VoiceResponse object
-    response = VoiceResponse()
-
-    # Instruct Twilio to say an initial greeting using its TTS.
-    # This is heard by the person who answers the outgoing call.
-    response.say("Hello! This is Alex from Super Truck AI.")
-
-    # Create a TwiML <Connect> verb object
-    connect = Connect()
-
     # Define the WebSocket URL, embedding context for the outgoing call.
-    websocket_url = f"wss://{settings.BASE_URL.split('//')[1]}/media-stream/{call_sid}/{to_phone_number}"
+    websocket_url = f"wss://{_WS_HOST}/media-stream/{call_sid}/{to_phone_number}"
     logger.info(f"[{call_sid}] Generating TwiML to connect OUTGOING call to WebSocket: {websocket_url}")
 
-    # Instruct Twilio to stream the call's audio to our WebSocket endpoint.
-    connect.stream(url=websocket_url)
-
-    # Append the <Connect> verb to the response
-    response.append(connect)
-
-    # Return the TwiML response as an XML string
-    return str(response)
+    # <Say> the initial greeting (heard by whoever answers), then <Connect> the <Stream>
+    return _OUTGOING_TMPL.replace(_WS_PLACEHOLDER, escape(websocket_url, _ATTR_ENTITIES).encode())
 
 
 # --- Twilio REST API Interaction Functions ---
@@ -128,8 +153,8 @@ async def make_twilio_outgoing_call(to_phone_number: str) -> str:
         # The Twilio Python helper library's methods (like calls.create) are synchronous.
         # In an async application (like FastAPI), blocking calls should be run
         # in a separate thread to avoid blocking the main event loop.
-        # `asyncio.to_thread` is the standard way to achieve this.
-        call = await asyncio.to_thread(
+        # `_run_twilio` does this on the dedicated Twilio thread pool.
+        call = await _run_twilio(
             twilio_client.calls.create, # The synchronous function to run
             to=to_phone_number,         # Destination number
             from_=settings.TWILIO_PHONE_NUMBER, # Your Twilio number from settings
@@ -137,7 +162,7 @@ async def make_twilio_outgoing_call(to_phone_number: str) -> str:
             # to this URL *when the called party answers*. This URL should point to
             # an endpoint in *this* application that returns the TwiML generated by
             # `create_outgoing_connect_stream_twiml`.
-            url=f"{settings.BASE_URL}/telephony/outgoing-call-handler" # Example webhook URL
+            url=_OUTGOING_WEBHOOK_URL
         )
         logger.info(f"Outgoing call initiated successfully to {to_phone_number}, CallSid: {call.sid}")
         # Return the unique identifier for the newly created call
@@ -162,8 +187,8 @@ async def buy_twilio_number(area_code: int) -> Optional[str]:
       """
       try:
             logger.info(f"Searching for available Twilio numbers in area code {area_code}")
-            # Use asyncio.to_thread again for the synchronous Twilio SDK call
-            available_numbers = await asyncio.to_thread(
+            # Use the Twilio thread pool again for the synchronous Twilio SDK call
+            available_numbers = await _run_twilio(
                 twilio_client.available_phone_numbers("US").local.list, # Sync function
                 area_code=area_code, # Filter by area code
                 limit=1              # Only need to find one number
@@ -177,7 +202,7 @@ async def buy_twilio_number(area_code: int) -> Optional[str]:
                 logger.info(f"Found available number: {number_to_buy}. Attempting to purchase...")
 
                 # Attempt to purchase the found number using another sync SDK call
-                purchased_number = await asyncio.to_thread(
+                purchased_number = await _run_twilio(
                     twilio_client.incoming_phone_numbers.create, # Sync function
                     phone_number=number_to_buy # Specify the number to purchase
                 )